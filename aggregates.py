@@ -0,0 +1,56 @@
+from sqlalchemy import text
+
+# Tabelas materializadas do ranking geral: personal_best (melhor pontuação de
+# cada jogador em cada música) e player_stats (soma dos recordes e quantas
+# músicas cada jogador já jogou). O servidor as atualiza a cada lote gravado;
+# estas consultas refazem tudo a partir da tabela score, para preencher um
+# banco antigo e para conferir se a versão incremental não se perdeu.
+
+# Empate na mesma música: vale a pontuação mais antiga (menor id), como nos rankings.
+RECOMPUTE_PERSONAL_BESTS = """
+    SELECT music_name, player_name, score_value, id AS score_id FROM (
+        SELECT music_name, player_name, score_value, id,
+               ROW_NUMBER() OVER (PARTITION BY music_name, player_name
+                                  ORDER BY score_value DESC, id ASC) AS position
+        FROM score
+    ) WHERE position = 1
+"""
+
+RECOMPUTE_PLAYER_STATS = f"""
+    SELECT player_name, SUM(score_value) AS total_score, COUNT(*) AS songs_played
+    FROM ({RECOMPUTE_PERSONAL_BESTS}) GROUP BY player_name
+"""
+
+REBUILD_STATEMENTS = [
+    "DELETE FROM personal_best",
+    "DELETE FROM player_stats",
+    f"INSERT INTO personal_best (music_name, player_name, score_value, score_id) {RECOMPUTE_PERSONAL_BESTS}",
+    "INSERT INTO player_stats (player_name, total_score, songs_played) "
+    "SELECT player_name, SUM(score_value), COUNT(*) FROM personal_best GROUP BY player_name",
+]
+
+_COMPARED = {
+    'personal_best': ("SELECT music_name, player_name, score_value, score_id FROM personal_best",
+                      RECOMPUTE_PERSONAL_BESTS),
+    'player_stats': ("SELECT player_name, total_score, songs_played FROM player_stats",
+                     RECOMPUTE_PLAYER_STATS),
+}
+
+
+def verify(conn):
+    """
+    Compara cada tabela com o recálculo completo e devolve {tabela: linhas
+    diferentes} (linhas que sobram de um lado ou faltam do outro).
+    """
+    differences = {}
+    for table, (stored, recomputed) in _COMPARED.items():
+        differences[table] = conn.execute(text(
+            f"SELECT (SELECT COUNT(*) FROM ({stored} EXCEPT {recomputed})) + "
+            f"(SELECT COUNT(*) FROM ({recomputed} EXCEPT {stored}))")).scalar()
+    return differences
+
+
+def rebuild(conn):
+    """Refaz as duas tabelas do zero, numa transação só (segura as gravações enquanto roda)."""
+    for statement in REBUILD_STATEMENTS:
+        conn.execute(text(statement))
@@ -1,14 +1,47 @@
 import os
 import json
-from flask import Flask, render_template, request, jsonify
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import click
+from datetime import datetime, timezone
+from flask import (Blueprint, Flask, Response, current_app, render_template, request, jsonify, send_file,
+                   stream_with_context, url_for)
+from werkzeug.utils import safe_join
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, event, or_, text, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import aliased
+from catalog import SongCatalog
+from leaderboard import LeaderboardCache
+from ingest import ScoreWriter
+from jobs import BeatmapJobQueue
+from config import CONFIGS
+import migrations
+import manifesto
+import beatmap_format
+import retention
+import aggregates
+from metrics import Metrics, Callback
 
-app = Flask(__name__)
+db = SQLAlchemy()
+catalog = SongCatalog()
+bp = Blueprint('game', __name__, cli_group=None)
+AUDIO_MAX_AGE = 365 * 24 * 60 * 60
 
-basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'scores.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL deixa as leituras seguirem durante a gravação dos lotes de pontuação;
+    # com WAL, synchronous=NORMAL só sincroniza o disco nos checkpoints e
+    # continua consistente (uma queda de energia perde no máximo o último lote).
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
 
 class Score(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,61 +49,848 @@ class Score(db.Model):
     score_value = db.Column(db.Integer, nullable=False)
     music_name = db.Column(db.String(50), nullable=False)
 
-@app.route('/')
+    __table_args__ = (
+        db.Index('ix_score_music_value', 'music_name', score_value.desc()),
+        db.Index('ix_score_music_player_value', 'music_name', 'player_name', score_value.desc()),
+    )
+
+class ScoreSummary(db.Model):
+    """Pontuações removidas pela compactação: quantas eram e o histograma delas."""
+    music_name = db.Column(db.String(50), primary_key=True)
+    archived_count = db.Column(db.Integer, nullable=False, default=0)
+    histogram = db.Column(db.Text, nullable=False, default='{}')
+    max_value = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime)
+
+class PersonalBest(db.Model):
+    """Melhor pontuação de cada jogador em cada música (mantida por write_scores)."""
+    music_name = db.Column(db.String(50), primary_key=True)
+    player_name = db.Column(db.String(10), primary_key=True)
+    score_value = db.Column(db.Integer, nullable=False)
+    score_id = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_personal_best_player', 'player_name', score_value.desc()),
+    )
+
+class PlayerStats(db.Model):
+    """Totais de cada jogador para o ranking geral: soma dos recordes pessoais e músicas jogadas."""
+    player_name = db.Column(db.String(10), primary_key=True)
+    total_score = db.Column(db.Integer, nullable=False, default=0)
+    songs_played = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_player_stats_total', total_score.desc(), 'player_name'),
+    )
+
+def as_utc(moment):
+    # O SQLite devolve as datas sem fuso; elas são sempre gravadas em UTC.
+    return moment.replace(tzinfo=timezone.utc).isoformat() if moment else None
+
+class BeatmapJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    song_id = db.Column(db.String(200), nullable=False, index=True)
+    mode = db.Column(db.String(10), nullable=False)
+    difficulty = db.Column(db.String(1), nullable=False)
+    seed = db.Column(db.Integer)
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, done, failed
+    note_count = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    worker_pid = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    finished_at = db.Column(db.DateTime)
+
+    def matches(self, mode, difficulty, seed):
+        return (self.mode, self.difficulty, self.seed) == (mode, difficulty, seed)
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'song': self.song_id, 'mode': self.mode, 'difficulty': self.difficulty,
+            'seed': self.seed, 'status': self.status, 'noteCount': self.note_count, 'error': self.error,
+            'createdAt': as_utc(self.created_at),
+            'finishedAt': as_utc(self.finished_at),
+            'url': url_for('game.get_beatmap_job', job_id=self.id),
+            'beatmapUrl': url_for('game.get_beatmap', song_id=self.song_id) if self.status == 'done' else None,
+        }
+
+def load_top_scores(music_name, limit):
+    return (Score.query.filter_by(music_name=music_name)
+            .order_by(Score.score_value.desc(), Score.id.asc()).limit(limit).all())
+
+def load_scores_since(after_id, limit):
+    """Linhas gravadas depois de after_id (por qualquer processo) e o maior id atual."""
+    latest_id = db.session.query(db.func.max(Score.id)).scalar() or 0
+    if after_id is None or latest_id <= after_id:
+        return [], latest_id
+    rows = Score.query.filter(Score.id > after_id).order_by(Score.id).limit(limit).all()
+    return rows, latest_id
+
+leaderboard = LeaderboardCache(load_top_scores, size=10, fetch_since=load_scores_since)
+
+SCORES_PAGE_SIZE = 50
+SCORES_PAGE_MAX = 200
+
+def parse_cursor(raw):
+    """Cursor de paginação no formato 'pontuação:id:posição' (a posição é opcional)."""
+    if not raw:
+        return None
+    parts = raw.split(':')
+    if len(parts) not in (2, 3):
+        raise ValueError(raw)
+    values = [int(p) for p in parts]
+    return values if len(values) == 3 else values + [None]
+
+def make_cursor(score, rank):
+    return f"{score.score_value}:{score.id}:{rank}"
+
+def count_ahead(music_name, score_value, score_id=None):
+    """Quantas pontuações ficam à frente de (score_value, score_id), contando só pelo índice."""
+    query = db.session.query(db.func.count(Score.id)).filter(Score.music_name == music_name)
+    if score_id is None:
+        query = query.filter(Score.score_value > score_value)
+    else:
+        query = query.filter(Score.score_value >= score_value,
+                             or_(Score.score_value > score_value, Score.id < score_id))
+    return query.scalar()
+
+def load_scores_page(music_name, cursor, limit):
+    """
+    Paginação por chave (keyset) sobre (score_value DESC, id ASC): cada página
+    começa logo depois da última linha da anterior, sem OFFSET.
+    Retorna (linhas com posição, cursor da próxima página ou None). A
+    posição conta também as pontuações arquivadas acima de cada linha, como
+    em /rank; o cursor guarda a posição só entre as linhas da tabela.
+    """
+    query = Score.query.filter_by(music_name=music_name)
+    first_rank = 1
+    if cursor:
+        after_value, after_id, after_rank = cursor
+        query = query.filter(Score.score_value <= after_value,
+                             or_(Score.score_value < after_value, Score.id > after_id))
+        if after_rank is None:
+            after_rank = count_ahead(music_name, after_value, after_id) + 1
+        first_rank = after_rank + 1
+    rows = query.order_by(Score.score_value.desc(), Score.id.asc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    stored = [(first_rank + i, row) for i, row in enumerate(rows[:limit])]
+    next_cursor = make_cursor(stored[-1][1], stored[-1][0]) if has_more else None
+    above = archived_above(music_name)
+    return [(rank + above(row.score_value), row) for rank, row in stored], next_cursor
+
+def archived_above(music_name):
+    """
+    Função pontuação -> quantas pontuações arquivadas pela compactação ficam
+    acima dela (estimativa pelo histograma do ScoreSummary; 0 sem compactação).
+    """
+    summary = db.session.get(ScoreSummary, music_name)
+    if summary is None or not summary.archived_count:
+        return lambda score_value: 0
+    histogram = retention.load_histogram(summary.histogram)
+    return lambda score_value: retention.count_above(histogram, score_value, summary.archived_count,
+                                                     summary.max_value)
+
+def update_player_stats(new_scores):
+    """
+    Leva as pontuações recém-inseridas para personal_best e player_stats, na
+    mesma transação. Tem que rodar depois do flush dos inserts: com o lock de
+    escrita do SQLite já na mão, outro processo não muda os totais no meio.
+    """
+    best = {}
+    for s in new_scores:
+        key = (s.music_name, s.player_name)
+        if key not in best or (s.score_value, -s.id) > (best[key].score_value, -best[key].id):
+            best[key] = s
+    stored = {(pb.music_name, pb.player_name): pb for pb in PersonalBest.query.filter(
+        tuple_(PersonalBest.music_name, PersonalBest.player_name).in_(list(best)))}
+    gains = {}  # jogador -> [pontos a somar, músicas novas]
+    for (music_name, player_name), s in best.items():
+        pb = stored.get((music_name, player_name))
+        gain = gains.setdefault(player_name, [0, 0])
+        if pb is None:
+            db.session.add(PersonalBest(music_name=music_name, player_name=player_name,
+                                        score_value=s.score_value, score_id=s.id))
+            gain[0] += s.score_value
+            gain[1] += 1
+        elif s.score_value > pb.score_value:
+            gain[0] += s.score_value - pb.score_value
+            pb.score_value, pb.score_id = s.score_value, s.id
+    stats = {p.player_name: p for p in PlayerStats.query.filter(PlayerStats.player_name.in_(list(gains)))}
+    for player_name, (points, songs) in gains.items():
+        if not points and not songs:
+            continue
+        player = stats.get(player_name)
+        if player is None:
+            player = PlayerStats(player_name=player_name, total_score=0, songs_played=0)
+            db.session.add(player)
+        player.total_score += points
+        player.songs_played += songs
+
+def parse_player_cursor(raw):
+    """Cursor do ranking geral no formato 'total:posição:jogador' (o nome pode ter ':')."""
+    if not raw:
+        return None
+    parts = raw.split(':', 2)
+    if len(parts) != 3:
+        raise ValueError(raw)
+    return int(parts[0]), int(parts[1]), parts[2]
+
+def load_players_page(cursor, limit):
+    """
+    Página do ranking geral por chave sobre (total_score DESC, player_name ASC),
+    andando pelo índice ix_player_stats_total. Retorna (linhas com posição,
+    cursor da próxima página ou None).
+    """
+    query = PlayerStats.query
+    first_rank = 1
+    if cursor:
+        after_total, after_rank, after_name = cursor
+        query = query.filter(PlayerStats.total_score <= after_total,
+                             or_(PlayerStats.total_score < after_total, PlayerStats.player_name > after_name))
+        first_rank = after_rank + 1
+    rows = query.order_by(PlayerStats.total_score.desc(), PlayerStats.player_name.asc()).limit(limit + 1).all()
+    ranked = [(first_rank + i, row) for i, row in enumerate(rows[:limit])]
+    next_cursor = None
+    if len(rows) > limit:
+        rank, last = ranked[-1]
+        next_cursor = f"{last.total_score}:{rank}:{last.player_name}"
+    return ranked, next_cursor
+
+def player_rank(player):
+    ahead = db.session.query(db.func.count(PlayerStats.player_name)).filter(
+        PlayerStats.total_score >= player.total_score,
+        or_(PlayerStats.total_score > player.total_score, PlayerStats.player_name < player.player_name)).scalar()
+    return ahead + 1
+
+def write_scores(batch):
+    new_scores = [Score(**item) for item in batch]
+    db.session.add_all(new_scores)
+    db.session.flush()
+    update_player_stats(new_scores)
+    db.session.commit()
+    for s in new_scores:
+        leaderboard.offer(s.music_name, s.id, s.player_name, s.score_value)
+
+score_writer = ScoreWriter(write_scores)
+
+def score_standing(music_name, score_value):
+    """
+    (pontuações acima, pontuações abaixo, total) contando também as
+    arquivadas pela compactação, que entram pelo histograma do ScoreSummary
+    (as contagens delas são estimativas dentro de cada balde).
+    """
+    above = count_ahead(music_name, score_value)
+    below = db.session.query(db.func.count(Score.id)).filter(
+        Score.music_name == music_name, Score.score_value < score_value).scalar()
+    total = db.session.query(db.func.count(Score.id)).filter(Score.music_name == music_name).scalar()
+    summary = db.session.get(ScoreSummary, music_name)
+    if summary is not None:
+        histogram = retention.load_histogram(summary.histogram)
+        highest = summary.max_value
+        below += retention.count_below(histogram, score_value, highest)
+        above += retention.count_above(histogram, score_value, summary.archived_count, highest)
+        total += summary.archived_count
+    return above, below, total
+
+def score_table_bytes():
+    """Bytes ocupados pela tabela score e seus índices (estimativa se o SQLite não tiver dbstat)."""
+    with db.engine.connect() as conn:
+        try:
+            return conn.execute(text(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = 'score' OR name IN "
+                "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'score')")).scalar() or 0
+        except Exception:
+            # Sem dbstat: supõe que o arquivo inteiro é da tabela score (superestima).
+            pages = conn.execute(text('PRAGMA page_count')).scalar()
+            return pages * conn.execute(text('PRAGMA page_size')).scalar()
+
+def droppable_scores(music_name, cursor, limit):
+    """
+    Próxima página do ranking depois de `cursor` (pontuação, id) e, dela, as
+    linhas que não são o recorde pessoal do jogador: existe outra linha do
+    mesmo jogador com pontuação maior, ou igual e mais antiga.
+    A linha com o maior id da tabela nunca sai: o id do score não tem
+    AUTOINCREMENT, e o SQLite reaproveitaria esse id na próxima pontuação,
+    que os outros processos (LeaderboardCache.sync, que anda por id) já
+    consideram vista.
+    Retorna ([(id, pontuação) removíveis], cursor da próxima página ou None).
+    """
+    after_value, after_id = cursor
+    page = (Score.query.with_entities(Score.id, Score.score_value, Score.player_name)
+            .filter(Score.music_name == music_name, Score.score_value <= after_value,
+                    or_(Score.score_value < after_value, Score.id > after_id))
+            .order_by(Score.score_value.desc(), Score.id.asc()).limit(limit).all())
+    if not page:
+        return [], None
+    better = aliased(Score)
+    has_better = (db.session.query(better.id)
+                  .filter(better.music_name == music_name, better.player_name == Score.player_name,
+                          or_(better.score_value > Score.score_value,
+                              and_(better.score_value == Score.score_value, better.id < Score.id)))
+                  .exists())
+    # O maior id só cresce: o que está abaixo dele agora continua abaixo na hora do DELETE.
+    newest_id = db.session.query(db.func.max(Score.id)).scalar()
+    drop = (Score.query.with_entities(Score.id, Score.score_value)
+            .filter(Score.id.in_([row.id for row in page]), Score.id < newest_id, has_better).all())
+    return [(row.id, row.score_value) for row in drop], (page[-1].score_value, page[-1].id)
+
+def compact_song(music_name, keep_top, batch_size=500, dry_run=False, pause=0.0):
+    """
+    Remove as pontuações de uma música que não estão no top `keep_top` nem
+    são o recorde pessoal de alguém, somando-as no histograma do
+    ScoreSummary. Anda pelo ranking abaixo do top em lotes de `batch_size`,
+    cada lote numa transação curta, para não segurar o banco enquanto as
+    pontuações novas chegam pela fila de gravação. Retorna quantas saíram.
+    """
+    top = load_top_scores(music_name, keep_top)
+    db.session.rollback()
+    if len(top) < keep_top:
+        return 0
+    # Pontuações novas só empurram o top para baixo: o que já estava fora dele continua fora.
+    cursor = (top[-1].score_value, top[-1].id)
+    removed = 0
+    while cursor is not None:
+        drop, cursor = droppable_scores(music_name, cursor, batch_size)
+        db.session.rollback()  # Fecha a leitura antes de pedir o lock de escrita.
+        if not drop or dry_run:
+            removed += len(drop)
+            continue
+        # O DELETE vem primeiro: a transação já começa com o lock de escrita.
+        Score.query.filter(Score.id.in_([score_id for score_id, _ in drop])).delete(synchronize_session=False)
+        summary = db.session.get(ScoreSummary, music_name) or ScoreSummary(music_name=music_name)
+        histogram = retention.add_to_histogram(retention.load_histogram(summary.histogram),
+                                               [value for _, value in drop])
+        summary.histogram = retention.dump_histogram(histogram)
+        summary.archived_count = (summary.archived_count or 0) + len(drop)
+        summary.max_value = max([value for _, value in drop] +
+                                ([summary.max_value] if summary.max_value is not None else []))
+        summary.updated_at = datetime.now(timezone.utc)
+        db.session.add(summary)
+        db.session.commit()
+        removed += len(drop)
+        if pause:
+            time.sleep(pause)
+    return removed
+
+def finish_beatmap_job(job_id, resumo):
+    job = db.session.get(BeatmapJob, job_id)
+    if job is None:
+        return
+    job.status = 'done' if resumo['ok'] else 'failed'
+    job.note_count = resumo.get('notas') if resumo['ok'] else None
+    job.error = resumo.get('erro')
+    job.finished_at = datetime.now(timezone.utc)
+    db.session.commit()
+    if resumo['ok']:
+        # Registra a geração no manifesto, para o assistente não refazer à toa.
+        manifesto.atualizar(catalog.beatmaps_dir, {job.song_id: resumo['manifesto']})
+        catalog.invalidate(job.song_id)
+
+beatmap_jobs = BeatmapJobQueue(finish_beatmap_job)
+
+metrics = Metrics()
+metrics.register(Callback('guitarflask_catalog_lookups_total', 'Consultas ao catálogo em memória.',
+                          lambda: catalog.lookups, 'counter'))
+metrics.register(Callback('guitarflask_catalog_scans_total', 'Varreduras da pasta de beatmaps.',
+                          lambda: catalog.scans, 'counter'))
+metrics.register(Callback('guitarflask_catalog_entry_hits_total', 'Beatmaps reaproveitados numa varredura.',
+                          lambda: catalog.entry_hits, 'counter'))
+metrics.register(Callback('guitarflask_catalog_entry_misses_total', 'Beatmaps relidos do disco.',
+                          lambda: catalog.entry_misses, 'counter'))
+metrics.register(Callback('guitarflask_leaderboard_cache_hits_total', 'Top-10 servidos da memória.',
+                          lambda: leaderboard.hits, 'counter'))
+metrics.register(Callback('guitarflask_leaderboard_cache_misses_total', 'Top-10 carregados do banco.',
+                          lambda: leaderboard.misses, 'counter'))
+metrics.register(Callback('guitarflask_score_queue_pending', 'Pontuações aguardando gravação.',
+                          score_writer.pending))
+BEATMAP_MODES = ('aleatorio', 'analise')
+BEATMAP_DIFFICULTIES = ('1', '2', '3')
+BULK_SUBMIT_MAX = 1000
+# Bem acima do que uma partida consegue fazer, e longe do limite do INTEGER do SQLite.
+SCORE_MAX = 1_000_000_000
+
+def parse_score_payload(data):
+    """Valida o JSON de uma pontuação e devolve os campos do modelo, ou None se for inválido."""
+    if not isinstance(data, dict) or 'name' not in data or 'score' not in data or 'music' not in data:
+        return None
+    try:
+        score_value = int(data['score'])
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if not 0 <= score_value <= SCORE_MAX:
+        return None
+    return {'player_name': str(data['name']), 'score_value': score_value, 'music_name': str(data['music'])}
+
+_hash_cache = {}
+_hash_lock = threading.Lock()
+
+def content_hash(path):
+    """SHA-256 do conteúdo do arquivo, recalculado só quando mtime/tamanho mudam."""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _hash_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    with _hash_lock:
+        _hash_cache[path] = (signature, h.hexdigest())
+    return h.hexdigest()
+
+def parse_job_payload(data):
+    """Valida modo/dificuldade/semente de um job e devolve (modo, dificuldade, semente), ou None."""
+    mode = data.get('mode', 'analise')
+    difficulty = str(data.get('difficulty', '2'))
+    seed = data.get('seed')
+    if mode not in BEATMAP_MODES or difficulty not in BEATMAP_DIFFICULTIES:
+        return None
+    if seed not in (None, ''):
+        try:
+            seed = int(seed)
+        except (TypeError, ValueError):
+            return None
+    else:
+        seed = None
+    return mode, difficulty, seed
+
+def process_alive(pid):
+    if pid is None or os.name != 'posix':
+        return True  # Sem como conferir: supõe que sim.
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def enqueue_beatmap_job(song_id, mode, difficulty, seed):
+    """
+    Cria o job e manda para o pool. Se a música já tem um job na fila, não
+    cria outro (os dois gravariam o mesmo beatmap) e devolve o da fila: o
+    chamador confere com `matches` se é o mesmo pedido.
+    """
+    pending = BeatmapJob.query.filter_by(song_id=song_id, status='queued').first()
+    if pending is not None and process_alive(pending.worker_pid):
+        return pending
+    job = BeatmapJob(song_id=song_id, mode=mode, difficulty=difficulty, seed=seed, worker_pid=os.getpid())
+    db.session.add(job)
+    db.session.commit()
+    # O pool roda em outros processos: os caminhos vão absolutos.
+    beatmap_jobs.submit(job.id, nome_base_arquivo=song_id, modo='1' if mode == 'aleatorio' else '2',
+                        chave_dificuldade=difficulty, seed=seed,
+                        pasta_audio=current_app.config['AUDIO_DIR'], pasta_beatmaps=catalog.beatmaps_dir)
+    return job
+
+def queued_job_response(job, options):
+    """202 com o job; 409 se a fila já tinha outro job da música com outros parâmetros."""
+    location = {'Location': url_for('game.get_beatmap_job', job_id=job.id)}
+    if not job.matches(*options):
+        return jsonify({'status': 'error', 'message': 'Já há uma geração com outros parâmetros na fila para essa música',
+                        'job': job.to_dict()}), 409, location
+    return jsonify(job.to_dict()), 202, location
+
+def audio_path(song_id):
+    return safe_join(current_app.config['AUDIO_DIR'], f"{song_id}.mp3")
+
+def audio_url(song_id):
+    """
+    URL do áudio com a versão (hash do conteúdo) quando ela já é conhecida.
+    Não calcula hash aqui, para a lista de músicas continuar barata; o
+    primeiro download calcula, e as listagens seguintes já trazem a versão.
+    """
+    cached = _hash_cache.get(audio_path(song_id))
+    if cached:
+        return url_for('game.get_audio', song_id=song_id, v=cached[1])
+    return url_for('game.get_audio', song_id=song_id)
+
+def init_db():
+    db.create_all()
+    migrations.upgrade(db.engine)
+
+def warm_caches():
+    """
+    Carrega o catálogo e calcula os hashes dos áudios antes de atender
+    requisições. Com o gunicorn em modo preload isso roda uma vez no processo
+    mestre, e os workers herdam tudo pronto no fork.
+    """
+    for song in catalog.songs():
+        path = audio_path(song['id'])
+        if path is not None and os.path.isfile(path):
+            content_hash(path)
+
+def create_app(config_name=None):
+    """
+    Monta o app com a configuração pedida ('development' ou 'production';
+    padrão: variável GUITARFLASK_CONFIG ou 'development').
+    """
+    app = Flask(__name__)
+    app.config.from_object(CONFIGS[config_name or os.environ.get('GUITARFLASK_CONFIG', 'development')])
+    db.init_app(app)
+    catalog.init_app(app)
+    score_writer.init_app(app)
+    beatmap_jobs.init_app(app)
+    metrics.init_app(app)
+    leaderboard.sync_interval = app.config['LEADERBOARD_SYNC_INTERVAL']
+    app.register_blueprint(bp)
+    with app.app_context():
+        init_db()
+        if app.config['WARM_CACHES']:
+            warm_caches()
+        # Conexões abertas aqui não podem ser herdadas pelos workers no fork.
+        db.engine.dispose()
+    return app
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/api/songs')
+@bp.route('/sw.js')
+def service_worker():
+    # Servido na raiz para que o service worker controle o site inteiro.
+    path = os.path.join(current_app.static_folder, 'js', 'sw.js')
+    response = send_file(path, mimetype='application/javascript', max_age=0)
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/healthz')
+def health():
+    """Liveness: o processo está de pé e atendendo."""
+    return jsonify({'status': 'ok'})
+
+@bp.route('/readyz')
+def readiness():
+    """Readiness: banco acessível e migrado, catálogo legível e fila de gravação aceitando."""
+    checks = {}
+    try:
+        with db.engine.connect() as conn:
+            version = conn.execute(text('PRAGMA user_version')).scalar()
+        checks['database'] = version >= len(migrations.MIGRATIONS)
+    except Exception:
+        current_app.logger.exception("Banco indisponível")
+        checks['database'] = False
+    try:
+        catalog.songs()
+        checks['catalog'] = True
+    except OSError:
+        checks['catalog'] = False
+    checks['score_queue'] = score_writer.accepting()
+    ready = all(checks.values())
+    return jsonify({'status': 'ready' if ready else 'unavailable', 'checks': checks}), 200 if ready else 503
+
+@bp.route('/api/songs')
 def get_songs():
-    song_list = []
-    beatmaps_dir = os.path.join(app.static_folder, 'beatmaps')
     try:
-        for filename in os.listdir(beatmaps_dir):
-            if filename.endswith('.json'):
-                song_id = filename.rsplit('.', 1)[0]
-                filepath = os.path.join(beatmaps_dir, filename)
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    song_list.append({
-                        'id': song_id,
-                        'name': data.get('songName', 'Nome Desconhecido'),
-                        'artist': data.get('artist', 'Artista Desconhecido')
-                    })
-    except Exception as e:
-        print(f"Erro ao ler os beatmaps: {e}")
+        songs = catalog.songs()
+    except Exception:
+        current_app.logger.exception("Erro ao ler os beatmaps")
         return jsonify({"error": "Não foi possível listar as músicas"}), 500
+    song_list = [
+        {
+            'id': song['id'], 'name': song['songName'], 'artist': song['artist'],
+            'duration': song['duration'], 'bpm': song['bpm'], 'noteCount': song['noteCount'],
+            'difficulties': song['difficulties'], 'audioUrl': audio_url(song['id'])
+        }
+        for song in songs
+    ]
     return jsonify(song_list)
 
-@app.route('/api/scores/<music_id>')
+@bp.route('/api/beatmaps/<song_id>')
+def get_beatmap(song_id):
+    if catalog.get(song_id) is None:
+        return jsonify({'error': 'Beatmap não encontrado'}), 404
+    beatmaps_dir = catalog.beatmaps_dir
+    try:
+        beatmap_format.ensure_compact(beatmaps_dir, song_id)
+    except (OSError, ValueError):
+        current_app.logger.exception("Erro ao gerar o beatmap compacto de '%s'", song_id)
+        return jsonify({'error': 'Não foi possível carregar o beatmap'}), 500
+    encodings = beatmap_format.available_encodings(beatmaps_dir, song_id)
+    encoding = request.accept_encodings.best_match(encodings, default='identity')
+    path = beatmap_format.compact_path(beatmaps_dir, song_id, encoding)
+    # ETag forte por variante: cada codificação tem bytes diferentes.
+    response = send_file(path, mimetype='application/json', conditional=True,
+                         etag=content_hash(path), max_age=0)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/api/beatmaps/jobs', methods=['POST'])
+def create_beatmap_job():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('song'), str):
+        return jsonify({'status': 'error', 'message': 'Informe a música em "song"'}), 400
+    options = parse_job_payload(data)
+    if options is None:
+        return jsonify({'status': 'error', 'message': 'Modo, dificuldade ou semente inválidos'}), 400
+    path = audio_path(data['song'])
+    if path is None or not os.path.isfile(path):
+        return jsonify({'status': 'error', 'message': 'Áudio não encontrado'}), 404
+    job = enqueue_beatmap_job(data['song'], *options)
+    return queued_job_response(job, options)
+
+@bp.route('/api/beatmaps/jobs/<int:job_id>')
+def get_beatmap_job(job_id):
+    job = db.session.get(BeatmapJob, job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job não encontrado'}), 404
+    if job.status == 'queued' and not process_alive(job.worker_pid):
+        # O processo que tinha o job saiu (reinício do servidor) antes de terminar.
+        job.status = 'failed'
+        job.error = 'Interrompido: o servidor foi reiniciado antes do fim do job'
+        job.finished_at = datetime.now(timezone.utc)
+        db.session.commit()
+    return jsonify(job.to_dict())
+
+@bp.route('/api/songs/upload', methods=['POST'])
+def upload_song():
+    """Recebe um MP3 (campo 'audio') e já enfileira a geração do beatmap."""
+    upload = request.files.get('audio')
+    if upload is None or not upload.filename:
+        return jsonify({'status': 'error', 'message': 'Envie o arquivo no campo "audio"'}), 400
+    name, extension = os.path.splitext(os.path.basename(upload.filename.replace('\\', '/')))
+    song_id = name.strip()
+    path = audio_path(song_id)
+    if extension.lower() != '.mp3' or not song_id or song_id.startswith('.') or path is None:
+        return jsonify({'status': 'error', 'message': 'Nome de arquivo inválido (use "Artista - Música.mp3")'}), 400
+    options = parse_job_payload(request.form)
+    if options is None:
+        return jsonify({'status': 'error', 'message': 'Modo, dificuldade ou semente inválidos'}), 400
+    if os.path.exists(path):
+        return jsonify({'status': 'error', 'message': 'Já existe uma música com esse nome'}), 409
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Nome único por envio: threads do mesmo worker recebendo ao mesmo tempo
+    # não podem dividir o arquivo temporário.
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.",
+                                     suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            upload.save(f)
+        os.chmod(temporary, 0o644)  # O mkstemp cria com 0600.
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except FileNotFoundError:
+            pass
+        raise
+    job = enqueue_beatmap_job(song_id, *options)
+    return queued_job_response(job, options)
+
+@bp.route('/audio/<song_id>')
+def get_audio(song_id):
+    path = audio_path(song_id)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'Áudio não encontrado'}), 404
+    version = content_hash(path)
+    # A URL versionada muda quando o arquivo muda, então pode ficar em cache
+    # para sempre; sem a versão certa, o navegador revalida pelo ETag.
+    immutable = request.args.get('v') == version
+    # conditional=True cuida de Range (206) e If-None-Match (304).
+    response = send_file(path, mimetype='audio/mpeg', conditional=True, etag=version,
+                         max_age=AUDIO_MAX_AGE if immutable else None)
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+@bp.route('/api/scores/<music_id>')
 def get_high_scores(music_id):
-    scores = Score.query.filter_by(music_name=music_id).order_by(Score.score_value.desc()).limit(10).all()
-    score_list = [
-        {'rank': i + 1, 'player_name': s.player_name, 'score_value': s.score_value}
-        for i, s in enumerate(scores)
-    ]
-    return jsonify(score_list)
+    return jsonify(leaderboard.top(music_id))
+
+@bp.route('/api/scores/<music_id>/stream')
+def stream_high_scores(music_id):
+    """
+    Server-sent events com o top da música: manda o ranking ao conectar e de
+    novo só quando ele muda. As conexões esperam o aviso do LeaderboardCache
+    e leem o top da memória; o banco só é consultado uma vez por processo.
+    """
+    config = current_app.config
+    keepalive = config['LEADERBOARD_STREAM_KEEPALIVE']
+    # Com vários processos, as mudanças dos outros só chegam pela sincronização
+    # do cache: acorda no ritmo dela para o top() sincronizar.
+    wait = min(keepalive, leaderboard.sync_interval or keepalive)
+
+    @stream_with_context
+    def events():
+        deadline = time.monotonic() + config['LEADERBOARD_STREAM_SECONDS']
+        yield 'retry: 3000\n\n'  # O navegador reconecta sozinho quando a conexão fecha.
+        last_payload, last_sent = None, time.monotonic()
+        while time.monotonic() < deadline:
+            version = leaderboard.version(music_id)
+            payload = json.dumps(leaderboard.top(music_id), ensure_ascii=False)
+            db.session.remove()  # Não segura uma conexão do pool enquanto espera.
+            if payload != last_payload:
+                yield f'data: {payload}\n\n'
+                last_payload, last_sent = payload, time.monotonic()
+            elif time.monotonic() - last_sent >= keepalive:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+            leaderboard.wait_for_change(music_id, version, wait)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/api/scores/<music_id>/page')
+def get_scores_page(music_id):
+    try:
+        cursor = parse_cursor(request.args.get('after'))
+        limit = min(max(int(request.args.get('limit', SCORES_PAGE_SIZE)), 1), SCORES_PAGE_MAX)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Parâmetros de paginação inválidos'}), 400
+    ranked, next_cursor = load_scores_page(music_id, cursor, limit)
+    return jsonify({
+        'scores': [
+            {'rank': rank, 'player_name': s.player_name, 'score_value': s.score_value}
+            for rank, s in ranked
+        ],
+        'next': next_cursor
+    })
+
+@bp.route('/api/scores/<music_id>/rank')
+def get_score_rank(music_id):
+    score_value = request.args.get('score', type=int)
+    if score_value is None:
+        return jsonify({'status': 'error', 'message': 'Informe a pontuação em ?score='}), 400
+    # Posição, total e percentil contam também as pontuações que a
+    # compactação já arquivou.
+    above, below, total = score_standing(music_id, score_value)
+    return jsonify({
+        'music': music_id,
+        'score': score_value,
+        'rank': above + 1,
+        'total': total,
+        'percentile': retention.percentile(below, total)
+    })
 
-@app.route('/submit-score', methods=['POST'])
+@bp.route('/api/leaderboard')
+def get_global_leaderboard():
+    try:
+        cursor = parse_player_cursor(request.args.get('after'))
+        limit = min(max(int(request.args.get('limit', SCORES_PAGE_SIZE)), 1), SCORES_PAGE_MAX)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Parâmetros de paginação inválidos'}), 400
+    ranked, next_cursor = load_players_page(cursor, limit)
+    return jsonify({
+        'players': [
+            {'rank': rank, 'player_name': p.player_name, 'total_score': p.total_score,
+             'songs_played': p.songs_played}
+            for rank, p in ranked
+        ],
+        'next': next_cursor
+    })
+
+@bp.route('/api/leaderboard/<player_name>')
+def get_player_stats(player_name):
+    player = db.session.get(PlayerStats, player_name)
+    if player is None:
+        return jsonify({'status': 'error', 'message': 'Jogador não encontrado'}), 404
+    bests = (PersonalBest.query.filter_by(player_name=player_name)
+             .order_by(PersonalBest.score_value.desc()).all())
+    return jsonify({
+        'player_name': player.player_name,
+        'rank': player_rank(player),
+        'total_score': player.total_score,
+        'songs_played': player.songs_played,
+        'bests': [{'music': pb.music_name, 'score_value': pb.score_value} for pb in bests]
+    })
+
+@bp.route('/submit-score', methods=['POST'])
 def submit_score():
-    data = request.get_json()
-    if not data or 'name' not in data or 'score' not in data or 'music' not in data:
+    data = request.get_json(silent=True)
+    fields = parse_score_payload(data)
+    if fields is None:
         return jsonify({'status': 'error', 'message': 'Dados inválidos'}), 400
-    new_score = Score(player_name=data['name'], score_value=int(data['score']), music_name=data['music'])
-    db.session.add(new_score)
-    db.session.commit()
-    return jsonify({'status': 'success', 'message': 'Pontuação salva!', 'music': data['music']})
+    if not score_writer.submit(fields):
+        return jsonify({'status': 'error', 'message': 'Servidor ocupado, tente novamente'}), 503
+    return jsonify({'status': 'success', 'message': 'Pontuação salva!', 'music': fields['music_name']})
+
+@bp.route('/submit-scores', methods=['POST'])
+def submit_scores_bulk():
+    data = request.get_json(silent=True)
+    if not isinstance(data, list) or not data:
+        return jsonify({'status': 'error', 'message': 'Envie uma lista de pontuações'}), 400
+    if len(data) > BULK_SUBMIT_MAX:
+        return jsonify({'status': 'error', 'message': f'Máximo de {BULK_SUBMIT_MAX} pontuações por envio'}), 413
+    batch = []
+    for i, item in enumerate(data):
+        fields = parse_score_payload(item)
+        if fields is None:
+            return jsonify({'status': 'error', 'message': f'Dados inválidos no item {i}'}), 400
+        batch.append(fields)
+    if not score_writer.submit_many(batch):
+        return jsonify({'status': 'error', 'message': 'Servidor ocupado, tente novamente'}), 503
+    return jsonify({'status': 'success', 'message': f'{len(batch)} pontuações recebidas!'}), 202
 
-@app.route('/scores/<music_name>')
+@bp.route('/scores/<music_name>')
 def show_scores(music_name):
-    scores = Score.query.filter_by(music_name=music_name).order_by(Score.score_value.desc()).all()
-    song_info = None
-    json_path = os.path.join(app.static_folder, 'beatmaps', f"{music_name}.json")
     try:
-        with open(json_path, 'r', encoding='utf-8') as f: song_info = json.load(f)
-    except FileNotFoundError: pass
-    return render_template('scores.html', scores=scores, music_name=music_name, song_info=song_info)
+        cursor = parse_cursor(request.args.get('after'))
+    except ValueError:
+        cursor = None
+    ranked, next_cursor = load_scores_page(music_name, cursor, SCORES_PAGE_SIZE)
+    song_info = catalog.get(music_name)
+    return render_template('score.html', scores=ranked, music_name=music_name, song_info=song_info,
+                           next_cursor=next_cursor, is_first_page=cursor is None)
+
+@bp.route('/leaderboard')
+def show_global_leaderboard():
+    try:
+        cursor = parse_player_cursor(request.args.get('after'))
+    except ValueError:
+        cursor = None
+    ranked, next_cursor = load_players_page(cursor, SCORES_PAGE_SIZE)
+    return render_template('leaderboard.html', players=ranked, next_cursor=next_cursor,
+                           is_first_page=cursor is None)
+
+@bp.cli.command('rebuild-player-stats')
+@click.option('--check', is_flag=True, help='Só confere; sai com erro se houver diferença.')
+def rebuild_player_stats_command(check):
+    """Confere o ranking geral com um recálculo completo a partir das pontuações e o refaz."""
+    with db.engine.connect() as conn:
+        differences = aggregates.verify(conn)
+    for table, count in differences.items():
+        click.echo(f"{table}: {count} linha(s) diferente(s) do recálculo")
+    if check:
+        if any(differences.values()):
+            raise SystemExit(1)
+        return
+    with db.engine.begin() as conn:
+        aggregates.rebuild(conn)
+    click.echo("Ranking geral refeito a partir da tabela score.")
+
+@bp.cli.command('compact-scores')
+@click.option('--dry-run', is_flag=True, help='Só mostra o que seria removido.')
+@click.option('--keep-top', type=int, default=None, help='Quantas pontuações manter no topo de cada música.')
+@click.option('--music', 'musics', multiple=True, help='Compacta só estas músicas (pode repetir).')
+def compact_scores_command(dry_run, keep_top, musics):
+    """Mantém o top N e o recorde pessoal de cada jogador; o resto vira histograma."""
+    config = current_app.config
+    keep_top = max(keep_top or config['SCORE_RETAIN_TOP'], leaderboard.size)
+    musics = musics or [m for (m,) in db.session.query(Score.music_name).distinct().order_by(Score.music_name)]
+    total_rows = db.session.query(db.func.count(Score.id)).scalar()
+    table_bytes = score_table_bytes()
+    removed = 0
+    for music in musics:
+        count = compact_song(music, keep_top, config['SCORE_COMPACT_BATCH'], dry_run,
+                             config['SCORE_COMPACT_PAUSE'])
+        removed += count
+        if count:
+            click.echo(f"{music}: {count} pontuações {'removíveis' if dry_run else 'removidas'}")
+    # Aproximação: os bytes da tabela e dos índices divididos igualmente entre as linhas.
+    reclaimed = table_bytes * removed // total_rows if total_rows else 0
+    verb = 'seriam liberados' if dry_run else 'liberados'
+    click.echo(f"Total: {removed} de {total_rows} pontuações; ~{reclaimed / 1024:.0f} KiB {verb} "
+               f"(tabela e índices ocupam {table_bytes / 1024:.0f} KiB)")
+    if removed and not dry_run:
+        click.echo("O espaço fica livre dentro do arquivo para as próximas gravações; "
+                   "para encolher o scores.db, rode VACUUM com o servidor parado.")
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run()
\ No newline at end of file
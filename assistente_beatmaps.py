@@ -1,8 +1,19 @@
 import os
+import sys
 import json
-import random
-import librosa
+import time
+import zlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 from mutagen.mp3 import MP3
+import cache_analise
+import beatmap_format
+import manifesto
+
+# O librosa (com numba e scipy) leva segundos para carregar: só as funções de
+# análise o importam, então o modo aleatório e os processos que nunca analisam
+# áudio não pagam esse custo.
 
 # --- CONFIGURAÇÕES ---
 PASTA_AUDIO = os.path.join('static', 'audio')
@@ -18,58 +29,417 @@ DIFICULDADES_ALEATORIO = {
     "2": {"nome": "Médio", "notas_por_segundo": 2.5},
     "3": {"nome": "Difícil", "notas_por_segundo": 4.0}
 }
+MODOS = {"aleatorio": "1", "analise": "2"}
+# Tudo o que muda o resultado da análise entra na chave do cache.
+PARAMETROS_ANALISE = {"sr": 22050, "hop_length": 512, "backtrack": True, "versao": 1}
+N_FFT_ANALISE = 2048
+# Faixas mais longas que isso são analisadas em blocos, com memória constante.
+LIMITE_STREAMING_SEGUNDOS = 15 * 60
+QUADROS_POR_BLOCO = 256
+QUADROS_POR_TRECHO_TEMPO = 2048
+# Suba quando a geração mudar de um jeito que valha refazer os beatmaps já gerados.
+VERSAO_GERADOR = 1
+INTERVALO_OBSERVAR_SEGUNDOS = 2.0
+INTERVALO_GRAVAR_MANIFESTO_SEGUNDOS = 5.0
+
+# --- FUNÇÕES DE GERAÇÃO ---
+
+def montar_notas(tempos, pistas):
+    return [{"time": t, "lane": l} for t, l in zip(np.round(tempos, 3).tolist(), pistas.tolist())]
+
+def gerar_charts_aleatorios(duracao_segundos, dificuldades=DIFICULDADES_ALEATORIO, rng=None):
+    """
+    Gera de uma vez um chart por dificuldade. Sorteia as notas da dificuldade
+    mais densa e cada uma das outras fica com um prefixo do sorteio: como os
+    tempos são independentes, o prefixo já é uma amostra aleatória, e os
+    charts mais fáceis são sempre subconjuntos dos mais difíceis.
+    """
+    rng = np.random.default_rng(rng)
+    tamanhos = {d["nome"]: int(duracao_segundos * d["notas_por_segundo"]) for d in dificuldades.values()}
+    total = max(tamanhos.values())
+    tempos = rng.uniform(1.5, duracao_segundos - 2.0, size=total)
+    pistas = rng.integers(1, 5, size=total)
+    charts = {}
+    for nome, tamanho in tamanhos.items():
+        ordem = np.argsort(tempos[:tamanho], kind='stable')
+        charts[nome] = montar_notas(tempos[ordem], pistas[ordem])
+    return charts
+
+def gerar_notas_aleatorias(duracao_segundos, dificuldade, rng=None):
+    return gerar_charts_aleatorios(duracao_segundos, {"1": dificuldade}, rng)[dificuldade["nome"]]
+
+def calcular_envelope_completo(caminho_mp3):
+    """Decodifica a faixa inteira e calcula o envelope de onsets de uma vez."""
+    import librosa
+    sr, hop_length = PARAMETROS_ANALISE["sr"], PARAMETROS_ANALISE["hop_length"]
+    y, sr = librosa.load(caminho_mp3, sr=sr)
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length, n_fft=N_FFT_ANALISE)
+    return onset_env, len(y) / sr
+
+def calcular_envelope_em_blocos(caminho_mp3, quadros_por_bloco=QUADROS_POR_BLOCO):
+    """
+    Mesmo envelope de calcular_envelope_completo, mas lendo o áudio em blocos
+    sobrepostos com librosa.stream: a memória usada não depende da duração.
+    O áudio fica na taxa original; a janela e o salto são escalados para
+    manter a mesma resolução de tempo da análise completa.
+    """
+    import librosa
+    sr_analise, hop_analise = PARAMETROS_ANALISE["sr"], PARAMETROS_ANALISE["hop_length"]
+    sr = librosa.get_samplerate(caminho_mp3)
+    escala = sr / sr_analise
+    hop_length, n_fft = int(round(hop_analise * escala)), int(round(N_FFT_ANALISE * escala))
+    filtro_mel = librosa.filters.mel(sr=sr, n_fft=n_fft, fmax=sr_analise / 2)
+
+    partes, ultimo_quadro, maximo_db = [], None, -np.inf
+    blocos = librosa.stream(caminho_mp3, block_length=quadros_por_bloco, frame_length=n_fft,
+                            hop_length=hop_length, mono=True, fill_value=0)
+    for y_bloco in blocos:
+        espectro = np.abs(librosa.stft(y_bloco, n_fft=n_fft, hop_length=hop_length, center=False)) ** 2
+        mel_db = librosa.power_to_db(filtro_mel @ espectro, top_db=None)
+        # O power_to_db da análise completa corta em 80 dB abaixo do máximo
+        # global; aqui só dá para usar o máximo visto até agora.
+        maximo_db = max(maximo_db, float(mel_db.max()))
+        mel_db = np.maximum(mel_db, maximo_db - 80.0)
+        if ultimo_quadro is not None:
+            mel_db = np.concatenate([ultimo_quadro, mel_db], axis=1)
+        partes.append(np.maximum(0.0, np.diff(mel_db, axis=1)).mean(axis=0))
+        ultimo_quadro = mel_db[:, -1:]
+
+    # Alinha com a análise completa (quadros centralizados): atraso do lag=1
+    # mais o preenchimento de meia janela em cada uma das duas etapas.
+    duracao = librosa.get_duration(path=caminho_mp3)
+    total_quadros = 1 + int(duracao * sr_analise) // hop_analise
+    atraso = 1 + 2 * (N_FFT_ANALISE // (2 * hop_analise))
+    onset_env = np.concatenate([np.zeros(atraso, dtype=np.float32)] + partes)[:total_quadros]
+    if len(onset_env) < total_quadros:
+        onset_env = np.pad(onset_env, (0, total_quadros - len(onset_env)))
+    return onset_env, duracao
+
+def estimar_tempo_em_trechos(onset_env, sr, hop_length, quadros_por_trecho=QUADROS_POR_TRECHO_TEMPO):
+    """
+    BPM pela mediana de trechos de tamanho fixo. O tempograma da faixa inteira
+    cresce com a duração (centenas de MB numa faixa de uma hora).
+    """
+    import librosa
+    tempos = [
+        librosa.feature.tempo(onset_envelope=onset_env[inicio:inicio + quadros_por_trecho],
+                              sr=sr, hop_length=hop_length)[0]
+        for inicio in range(0, max(len(onset_env) - quadros_por_trecho // 2, 1), quadros_por_trecho)
+    ]
+    return float(np.median(tempos))
 
-# --- FUNÇÕES DE GERAÇÃO (sem alterações) ---
-
-def gerar_notas_aleatorias(duracao_segundos, dificuldade):
-    notas_por_segundo = dificuldade["notas_por_segundo"]
-    num_notas = int(duracao_segundos * notas_por_segundo)
-    notes = []
-    for _ in range(num_notas):
-        notes.append({
-            "time": round(random.uniform(1.5, duracao_segundos - 2.0), 3),
-            "lane": random.randint(1, 4)
-        })
-    notes.sort(key=lambda x: x['time'])
-    return notes
-
-def gerar_notas_com_librosa(caminho_mp3, dificuldade):
+def analisar_audio(caminho_mp3, usar_cache=True, streaming=False):
+    """
+    Calcula o envelope de onsets, os onsets e as batidas de um MP3.
+    Com o cache ligado, só decodifica se esse áudio nunca foi analisado
+    com os mesmos PARAMETROS_ANALISE (e nem importa o librosa).
+    """
+    parametros = dict(PARAMETROS_ANALISE, streaming=True) if streaming else PARAMETROS_ANALISE
+    chave = None
+    if usar_cache:
+        chave = cache_analise.chave_cache(cache_analise.hash_arquivo(caminho_mp3), parametros)
+        dados = cache_analise.carregar(chave)
+        if dados is not None:
+            return dados
+
+    import librosa
     print(f"  Analisando '{os.path.basename(caminho_mp3)}' (isso pode demorar)...")
-    y, sr = librosa.load(caminho_mp3)
-    onset_frames = librosa.onset.onset_detect(y=y, sr=sr, units='frames', backtrack=True)
-    onset_times = librosa.frames_to_time(onset_frames, sr=sr)
-    probabilidade = dificuldade["probabilidade"]
-    notes = []
-    for time_sec in onset_times:
-        if random.random() < probabilidade:
-            notes.append({
-                "time": round(time_sec, 3),
-                "lane": random.randint(1, 4)
-            })
-    print(f"  └─ Librosa detectou {len(onset_times)} batidas. Selecionando {len(notes)}.")
-    return notes
+    sr, hop_length = PARAMETROS_ANALISE["sr"], PARAMETROS_ANALISE["hop_length"]
+    if streaming:
+        onset_env, duracao = calcular_envelope_em_blocos(caminho_mp3)
+    else:
+        onset_env, duracao = calcular_envelope_completo(caminho_mp3)
+    onset_frames = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, hop_length=hop_length,
+                                              units='frames', backtrack=PARAMETROS_ANALISE["backtrack"])
+    if streaming:
+        tempo = estimar_tempo_em_trechos(onset_env, sr, hop_length)
+        tempo, beat_frames = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length,
+                                                     bpm=tempo)
+    else:
+        tempo, beat_frames = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+    dados = {
+        "onset_env": onset_env.astype(np.float32),
+        "onset_frames": onset_frames.astype(np.int32),
+        "tempo": np.atleast_1d(tempo).astype(np.float32),
+        "beat_frames": beat_frames.astype(np.int32),
+        "duracao": np.float32(duracao),
+    }
+    if chave is not None:
+        cache_analise.salvar(chave, dados)
+    return dados
 
-# --- FUNÇÃO PRINCIPAL DO SCRIPT ---
+def selecionar_onsets(onset_times, dificuldades, rng):
+    """
+    Um único sorteio por onset decide em quais dificuldades ele vira nota
+    (sorteio < probabilidade), então os charts ficam aninhados.
+    """
+    sorteio = rng.random(len(onset_times))
+    pistas = rng.integers(1, 5, size=len(onset_times))
+    charts = {}
+    for d in dificuldades.values():
+        escolhidos = sorteio < d["probabilidade"]
+        charts[d["nome"]] = montar_notas(onset_times[escolhidos], pistas[escolhidos])
+    return charts
+
+def gerar_charts_com_librosa(caminho_mp3, dificuldades=DIFICULDADES_ANALISE, rng=None, usar_cache=True,
+                             streaming=False):
+    """Analisa o áudio uma vez e devolve (charts por dificuldade, BPM estimado)."""
+    rng = np.random.default_rng(rng)
+    dados = analisar_audio(caminho_mp3, usar_cache, streaming)
+    # Mesma conta do librosa.frames_to_time, sem carregar o librosa num acerto do cache.
+    onset_times = dados["onset_frames"] * PARAMETROS_ANALISE["hop_length"] / PARAMETROS_ANALISE["sr"]
+    charts = selecionar_onsets(onset_times, dificuldades, rng)
+    print(f"  └─ Librosa detectou {len(onset_times)} batidas. Selecionando "
+          + ", ".join(f"{len(notas)} ({nome})" for nome, notas in charts.items()) + ".")
+    return charts, int(round(float(dados["tempo"][0])))
+
+def gerar_notas_com_librosa(caminho_mp3, dificuldade, rng=None, usar_cache=True, streaming=False):
+    charts, _ = gerar_charts_com_librosa(caminho_mp3, {"1": dificuldade}, rng, usar_cache, streaming)
+    return charts[dificuldade["nome"]]
+
+# --- PROCESSAMENTO DE UMA MÚSICA ---
 
-def assistente_principal():
+def semente_da_musica(seed, nome_base_arquivo):
+    """Semente própria de cada música, para o resultado não depender da ordem do lote."""
+    if seed is None:
+        return None
+    return seed ^ zlib.crc32(nome_base_arquivo.encode('utf-8'))
+
+def processar_musica(nome_base_arquivo, modo, chave_dificuldade, seed=None, usar_cache=True, streaming=False,
+                     pasta_audio=PASTA_AUDIO, pasta_beatmaps=PASTA_BEATMAPS):
     """
-    Função principal que escaneia, pede configurações uma vez e processa em lote.
+    Gera e salva o beatmap de uma música. Roda dentro dos processos do lote
+    (ou da fila de jobs do servidor), por isso devolve um resumo em vez de
+    imprimir o resultado.
     """
-    print("--- Assistente de Beatmaps em Lote para Python Hero ---")
+    inicio = time.perf_counter()
+    resumo = {"nome": nome_base_arquivo, "ok": False, "notas": 0, "segundos": 0.0, "erro": None}
+    caminho_mp3 = os.path.join(pasta_audio, f"{nome_base_arquivo}.mp3")
+    rng = np.random.default_rng(semente_da_musica(seed, nome_base_arquivo))
 
-    if not os.path.isdir(PASTA_AUDIO) or not os.path.isdir(PASTA_BEATMAPS):
-        print("ERRO: Pastas 'static/audio' e/ou 'static/beatmaps' não encontradas.")
-        return
+    try:
+        # O hash vem antes da geração: se o MP3 mudar no meio, a próxima
+        # passada percebe a diferença e refaz.
+        stat = os.stat(caminho_mp3)
+        entrada_manifesto = manifesto.nova_entrada(caminho_mp3, cache_analise.hash_arquivo(caminho_mp3), modo,
+                                                   chave_dificuldade, seed, VERSAO_GERADOR, stat)
+        audio_info = MP3(caminho_mp3)
+        duracao_segundos = audio_info.info.length
+        minutos, segundos = int(duracao_segundos // 60), int(duracao_segundos % 60)
+        duracao_formatada = f"{minutos}:{segundos:02d}"
+
+        # Gera os charts de todas as dificuldades numa passada só
+        if modo == "1":
+            dificuldades = DIFICULDADES_ALEATORIO
+            charts, bpm = gerar_charts_aleatorios(duracao_segundos, dificuldades, rng), 120
+        else: # modo == "2"
+            dificuldades = DIFICULDADES_ANALISE
+            streaming = streaming or duracao_segundos > LIMITE_STREAMING_SEGUNDOS
+            charts, bpm = gerar_charts_com_librosa(caminho_mp3, dificuldades, rng, usar_cache, streaming)
+        notes = charts[dificuldades[chave_dificuldade]["nome"]]
+    except Exception as e:
+        resumo["erro"] = f"{type(e).__name__}: {e}"
+        resumo["segundos"] = time.perf_counter() - inicio
+        return resumo
+
+    # Extrai artista e nome
+    if " - " in nome_base_arquivo:
+        artista, nome_musica = [s.strip() for s in nome_base_arquivo.split(" - ", 1)]
+    else:
+        artista, nome_musica = "Artista Desconhecido", nome_base_arquivo.replace('_', ' ').title()
+
+    # Monta e salva o JSON. "notes" é o chart da dificuldade escolhida, para
+    # quem ainda não lê "charts".
+    beatmap_completo = {
+        "songName": nome_musica, "artist": artista, "duration": duracao_formatada,
+        "bpm": bpm, "notes": notes, "charts": charts
+    }
+
+    # Grava num temporário e troca de uma vez: o servidor pode estar lendo a
+    # pasta enquanto o beatmap é gerado, e nunca deve ver um JSON pela metade.
+    caminho_json_saida = os.path.join(pasta_beatmaps, f"{nome_base_arquivo}.json")
+    temporario = f"{caminho_json_saida}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(beatmap_completo, f, indent=4)
+    os.replace(temporario, caminho_json_saida)
+    beatmap_format.write_compact(beatmap_completo, pasta_beatmaps, nome_base_arquivo)
+
+    resumo.update(ok=True, notas=len(notes), segundos=time.perf_counter() - inicio, manifesto=entrada_manifesto)
+    return resumo
+
+def processar_em_lote(tarefas, workers=None, usar_cache=True, streaming=False, executor=None):
+    """
+    Distribui as tarefas (dicts com nome, modo, dificuldade e seed) entre
+    processos, mostra o progresso de cada uma e registra no manifesto as que
+    deram certo. Com `executor`, reaproveita um pool já aberto (modo --watch).
+    """
+    workers = workers or os.cpu_count() or 1
+    total = len(tarefas)
+    inicio = time.perf_counter()
+    falhas = []
+    print(f"\n--- INICIANDO PROCESSAMENTO EM LOTE ({total} música(s), {workers} processo(s)) ---")
+
+    proprio = executor is None
+    if proprio:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    mudancas, ultima_gravacao = {}, time.monotonic()
+    try:
+        futuros = {
+            executor.submit(processar_musica, t["nome"], t["modo"], t["dificuldade"], t["seed"],
+                            usar_cache, streaming): t["nome"]
+            for t in tarefas
+        }
+        for concluidas, futuro in enumerate(as_completed(futuros), start=1):
+            nome = futuros[futuro]
+            try:
+                resumo = futuro.result()
+            except Exception as e:
+                # Um processo que morreu (ex: falta de memória) não derruba o lote.
+                resumo = {"nome": nome, "ok": False, "segundos": 0.0, "erro": f"{type(e).__name__}: {e}"}
+            if resumo["ok"]:
+                mudancas[nome] = resumo["manifesto"]
+                print(f"[{concluidas}/{total}] ✅ '{nome}.mp3': {resumo['notas']} notas em {resumo['segundos']:.1f}s")
+            else:
+                falhas.append(resumo)
+                print(f"[{concluidas}/{total}] ❌ '{nome}.mp3': {resumo['erro']}")
+            # Grava o manifesto aos poucos: um lote interrompido não perde o que já foi feito.
+            if mudancas and time.monotonic() - ultima_gravacao > INTERVALO_GRAVAR_MANIFESTO_SEGUNDOS:
+                manifesto.atualizar(PASTA_BEATMAPS, mudancas)
+                mudancas, ultima_gravacao = {}, time.monotonic()
+    finally:
+        if mudancas:
+            manifesto.atualizar(PASTA_BEATMAPS, mudancas)
+        if proprio:
+            executor.shutdown()
+
+    print(f"\n--- Processamento em lote finalizado em {time.perf_counter() - inicio:.1f}s! "
+          f"{total - len(falhas)} ok, {len(falhas)} com erro ---")
+    return falhas
+
+def aquecer():
+    """
+    Roda a análise num trecho curto de ruído para o numba compilar as
+    funções do librosa antes da primeira música de verdade.
+    """
+    import librosa
+    sr, hop_length = PARAMETROS_ANALISE["sr"], PARAMETROS_ANALISE["hop_length"]
+    y = np.random.default_rng(0).standard_normal(2 * sr).astype(np.float32)
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
+    librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, hop_length=hop_length,
+                               backtrack=PARAMETROS_ANALISE["backtrack"])
+    librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+
+# --- PERFIL DE INICIALIZAÇÃO ---
+
+def perfil_inicializacao():
+    """Tempo de importação do assistente, da análise com librosa e do servidor web."""
+    import perfil_importacao
+    perfil_importacao.imprimir_relatorio("Assistente (modo aleatório)", "import assistente_beatmaps")
+    perfil_importacao.imprimir_relatorio("Análise de áudio (só no modo análise)", "import librosa.onset, librosa.beat")
+    perfil_importacao.imprimir_relatorio("Servidor web", "import app")
+
+# --- PLANEJAMENTO INCREMENTAL (MANIFESTO) ---
 
-    musicas_mp3 = {os.path.splitext(f)[0] for f in os.listdir(PASTA_AUDIO) if f.endswith('.mp3')}
-    beatmaps_existentes = {os.path.splitext(f)[0] for f in os.listdir(PASTA_BEATMAPS) if f.endswith('.json')}
-    musicas_faltando = list(musicas_mp3 - beatmaps_existentes)
+def assinaturas_audio():
+    """{música: stat} dos MP3s da pasta de áudio, só com stat (sem ler os arquivos)."""
+    with os.scandir(PASTA_AUDIO) as it:
+        return {os.path.splitext(e.name)[0]: e.stat() for e in it
+                if e.name.endswith('.mp3') and not e.name.startswith('.') and e.is_file()}
+
+def planejar(registros, configuracao=None, reaplicar=False, nomes=None):
+    """
+    Compara os MP3s com o manifesto e devolve (tarefas, mudanças no manifesto).
+    Cada tarefa traz o motivo e os parâmetros: os da `configuracao` (modo,
+    dificuldade, seed) para músicas novas, ou os gravados no manifesto para
+    as que só mudaram de áudio ou de versão do gerador. Com `reaplicar`, a
+    configuração vale para todas e refaz as geradas com outros parâmetros.
+    Com `nomes`, olha só essas músicas (modo --watch).
+    """
+    audios = assinaturas_audio()
+    existentes = {os.path.splitext(f)[0] for f in os.listdir(PASTA_BEATMAPS) if f.endswith('.json')}
+    tarefas, mudancas = [], {}
+    for nome in sorted(audios if nomes is None else set(nomes) & audios.keys()):
+        stat, entrada = audios[nome], registros.get(nome)
+        caminho_mp3 = os.path.join(PASTA_AUDIO, f"{nome}.mp3")
+        if nome not in existentes:
+            motivo = "nova"
+        else:
+            hash_atual = manifesto.hash_do_audio(caminho_mp3, entrada, stat)
+            if entrada is None:
+                # Beatmap de antes do manifesto (ou feito à mão): passa a ser
+                # acompanhado, mas só é refeito se o áudio mudar daqui em diante.
+                mudancas[nome] = manifesto.nova_entrada(caminho_mp3, hash_atual, None, None, None, None, stat)
+                continue
+            if entrada["hash_audio"] != hash_atual:
+                motivo = "áudio alterado"
+            elif entrada["modo"] is not None and entrada["versao_gerador"] != VERSAO_GERADOR:
+                motivo = "gerador atualizado"
+            elif reaplicar and configuracao and [entrada["modo"], entrada["dificuldade"], entrada["seed"]] \
+                    != list(configuracao):
+                motivo = "parâmetros alterados"
+            else:
+                if entrada["assinatura"] != manifesto.assinatura(stat):
+                    mudancas[nome] = dict(entrada, assinatura=manifesto.assinatura(stat))  # Só foi tocado.
+                continue
+        gravados = (entrada["modo"], entrada["dificuldade"], entrada["seed"]) if entrada and entrada["modo"] else None
+        parametros = configuracao if (reaplicar or gravados is None) else gravados
+        tarefas.append({"nome": nome, "motivo": motivo, "parametros": parametros})
+    if nomes is None:
+        mudancas.update({nome: None for nome in registros if nome not in audios})
+    return tarefas, mudancas
+
+def executar_plano(tarefas, configuracao, args, executor=None):
+    """Completa os parâmetros que faltam com a configuração e processa o lote."""
+    for tarefa in tarefas:
+        print(f"  - {tarefa['nome']}.mp3 ({tarefa['motivo']})")
+    lote = []
+    for tarefa in tarefas:
+        modo, chave_dificuldade, seed = tarefa["parametros"] or configuracao
+        lote.append({"nome": tarefa["nome"], "modo": modo, "dificuldade": chave_dificuldade, "seed": seed})
+    return processar_em_lote(lote, args.workers, usar_cache=not args.sem_cache, streaming=args.streaming,
+                             executor=executor)
+
+def observar(configuracao, args, intervalo=INTERVALO_OBSERVAR_SEGUNDOS):
+    """
+    Modo --watch: confere a pasta de áudio só pelo stat a cada `intervalo`
+    segundos e processa os MP3s novos ou alterados assim que param de mudar
+    (um arquivo ainda sendo copiado muda de tamanho entre uma volta e outra).
+    """
+    print(f"\nObservando '{PASTA_AUDIO}' (Ctrl+C para sair)...")
+    anteriores, processadas = {}, {}
+    executor = ProcessPoolExecutor(max_workers=args.workers or os.cpu_count() or 1)
+    try:
+        while True:
+            atuais = {nome: manifesto.assinatura(stat) for nome, stat in assinaturas_audio().items()}
+            prontas = [nome for nome, a in atuais.items() if anteriores.get(nome) == a and processadas.get(nome) != a]
+            removidas = [nome for nome in processadas if nome not in atuais]
+            if prontas:
+                tarefas, mudancas = planejar(manifesto.carregar(PASTA_BEATMAPS), configuracao, args.reaplicar, prontas)
+                if mudancas:
+                    manifesto.atualizar(PASTA_BEATMAPS, mudancas)
+                if tarefas:
+                    print(f"\n{len(tarefas)} música(s) para gerar:")
+                    executar_plano(tarefas, configuracao, args, executor)
+                processadas.update({nome: atuais[nome] for nome in prontas})
+            if removidas:
+                manifesto.atualizar(PASTA_BEATMAPS, {nome: None for nome in removidas})
+                for nome in removidas:
+                    processadas.pop(nome)
+            anteriores = atuais
+            time.sleep(intervalo)
+    except KeyboardInterrupt:
+        print("\nParando de observar a pasta.")
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return 0
 
-    if not musicas_faltando:
-        print("\nTodas as músicas na pasta 'audio' já possuem um beatmap. Tudo certo!")
-        return
+# --- FUNÇÃO PRINCIPAL DO SCRIPT ---
 
-    print(f"\nEncontrei {len(musicas_faltando)} música(s) sem beatmap:")
+def perguntar_configuracoes(musicas_faltando):
+    """
+    Modo interativo: mostra as músicas faltantes e pede as configurações uma vez.
+    """
+    print(f"\nEncontrei {len(musicas_faltando)} música(s) sem beatmap (ou sem parâmetros registrados):")
     for nome in musicas_faltando: 
         print(f"  - {nome}.mp3")
 
@@ -81,60 +451,79 @@ def assistente_principal():
         print("  ERRO: Opção inválida. Digite 1 ou 2.")
 
     dificuldades_atuais = DIFICULDADES_ALEATORIO if modo == "1" else DIFICULDADES_ANALISE
-    print("  Escolha a dificuldade:")
+    print("  Escolha a dificuldade padrão (todas serão geradas):")
     for key, value in dificuldades_atuais.items():
         print(f"    [{key}] - {value['nome']}")
     while True:
         escolha_dificuldade = input("  Digite o número da dificuldade: ").strip()
         if escolha_dificuldade in dificuldades_atuais:
-            dificuldade_selecionada = dificuldades_atuais[escolha_dificuldade]
             break
         else: print("  ERRO: Opção inválida. Tente novamente.")
-    
-    print("\n--- INICIANDO PROCESSAMENTO EM LOTE ---")
-    
-    # --- PROCESSA TODAS AS MÚSICAS FALTANTES COM AS MESMAS CONFIGURAÇÕES ---
-    for nome_base_arquivo in musicas_faltando:
-        caminho_mp3 = os.path.join(PASTA_AUDIO, f"{nome_base_arquivo}.mp3")
-        
-        try:
-            audio_info = MP3(caminho_mp3)
-            duracao_segundos = audio_info.info.length
-            minutos, segundos = int(duracao_segundos // 60), int(duracao_segundos % 60)
-            duracao_formatada = f"{minutos}:{segundos:02d}"
-        except Exception as e:
-            print(f"\nERRO ao ler '{nome_base_arquivo}.mp3'. Pulando. ({e})")
-            continue
-
-        # Gera as notas
-        if modo == "1":
-            notes = gerar_notas_aleatorias(duracao_segundos, dificuldade_selecionada)
-        else: # modo == "2"
-            try:
-                notes = gerar_notas_com_librosa(caminho_mp3, dificuldade_selecionada)
-            except Exception as e:
-                print(f"\n  └─ ERRO FATAL ao analisar '{nome_base_arquivo}.mp3' com Librosa: {e}")
-                continue
+    return modo, escolha_dificuldade
 
-        # Extrai artista e nome
-        if " - " in nome_base_arquivo:
-            artista, nome_musica = [s.strip() for s in nome_base_arquivo.split(" - ", 1)]
-        else:
-            artista, nome_musica = "Artista Desconhecido", nome_base_arquivo.replace('_', ' ').title()
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        description="Gera beatmaps para as músicas de static/audio que ainda não têm um. "
+                    "Sem --modo, pergunta as configurações interativamente.")
+    parser.add_argument("--modo", choices=sorted(MODOS), help="aleatorio (rápido) ou analise (batidas reais, lento)")
+    parser.add_argument("--dificuldade", choices=["1", "2", "3"], default="2",
+                        help="dificuldade padrão do beatmap (todas são geradas): "
+                             "1 = Fácil, 2 = Médio, 3 = Difícil (padrão: 2)")
+    parser.add_argument("--seed", type=int, default=None, help="semente para gerar mapas reproduzíveis")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="número de processos em paralelo (padrão: todos os núcleos)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="analisa todas as faixas em blocos (automático acima de "
+                             f"{LIMITE_STREAMING_SEGUNDOS // 60} minutos)")
+    parser.add_argument("--perfil-inicializacao", action="store_true",
+                        help="mostra o tempo de importação de cada dependência e sai")
+    parser.add_argument("--watch", action="store_true",
+                        help="continua rodando e gera os beatmaps conforme MP3s são adicionados ou trocados "
+                             "(exige --modo)")
+    parser.add_argument("--reaplicar", action="store_true",
+                        help="aplica --modo/--dificuldade/--seed também às músicas já geradas, "
+                             "refazendo as que foram geradas com outros parâmetros")
+    parser.add_argument("--sem-cache", action="store_true",
+                        help=f"ignora o cache de análise de áudio em '{cache_analise.PASTA_CACHE}'")
+    return parser
 
-        # Monta e salva o JSON
-        beatmap_completo = {
-            "songName": nome_musica, "artist": artista, "duration": duracao_formatada,
-            "bpm": 120, "notes": notes
-        }
-        
-        caminho_json_saida = os.path.join(PASTA_BEATMAPS, f"{nome_base_arquivo}.json")
-        with open(caminho_json_saida, 'w', encoding='utf-8') as f:
-            json.dump(beatmap_completo, f, indent=4)
-            
-        print(f"✅ Beatmap para '{nome_base_arquivo}.mp3' criado com sucesso!")
+def assistente_principal(argv=None):
+    """
+    Função principal que escaneia, define as configurações uma vez e processa em lote.
+    """
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+    if (args.watch or args.reaplicar) and not args.modo:
+        parser.error("--watch e --reaplicar exigem --modo")
+    if args.perfil_inicializacao:
+        perfil_inicializacao()
+        return 0
+
+    print("--- Assistente de Beatmaps em Lote para Python Hero ---")
+
+    if not os.path.isdir(PASTA_AUDIO) or not os.path.isdir(PASTA_BEATMAPS):
+        print("ERRO: Pastas 'static/audio' e/ou 'static/beatmaps' não encontradas.")
+        return 1
+
+    configuracao = (MODOS[args.modo], args.dificuldade, args.seed) if args.modo else None
+    if args.watch:
+        return observar(configuracao, args)
+
+    tarefas, mudancas = planejar(manifesto.carregar(PASTA_BEATMAPS), configuracao, args.reaplicar)
+    if mudancas:
+        manifesto.atualizar(PASTA_BEATMAPS, mudancas)
+    if not tarefas:
+        print("\nTodos os beatmaps estão em dia com os áudios da pasta 'audio'. Tudo certo!")
+        return 0
+
+    sem_parametros = [t["nome"] for t in tarefas if t["parametros"] is None]
+    if sem_parametros and configuracao is None:
+        modo, chave_dificuldade = perguntar_configuracoes(sem_parametros)
+        configuracao = (modo, chave_dificuldade, args.seed)
 
-    print("\n--- Processamento em lote finalizado! ---")
+    print(f"\n{len(tarefas)} música(s) para gerar:")
+    falhas = executar_plano(tarefas, configuracao, args)
+    return 1 if falhas else 0
 
 if __name__ == "__main__":
-    assistente_principal()
\ No newline at end of file
+    sys.exit(assistente_principal())
\ No newline at end of file
@@ -0,0 +1,122 @@
+import os
+import json
+import gzip
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # Opcional: sem ele, só gzip é gerado.
+    brotli = None
+
+# Formato compacto dos beatmaps (versão 2): JSON minificado e colunar.
+# Cada chart vira {"t": [...], "l": "..."}, com os tempos em milissegundos
+# inteiros codificados como diferença para a nota anterior e as pistas como
+# uma string com um dígito por nota. Se "notes" for igual a um dos charts,
+# guarda só o nome desse chart em vez de repetir as notas.
+COMPACT_VERSION = 2
+COMPACT_DIR_NAME = 'compact'
+
+# Extensão de cada variante pré-comprimida, pelo nome usado no Accept-Encoding.
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz', 'identity': ''}
+
+
+def encode_chart(notes):
+    notes = sorted(notes, key=lambda n: n['time'])
+    deltas, previous = [], 0
+    for note in notes:
+        ms = int(round(note['time'] * 1000))
+        deltas.append(ms - previous)
+        previous = ms
+    return {'t': deltas, 'l': ''.join(str(int(note['lane'])) for note in notes)}
+
+
+def decode_chart(chart):
+    notes, ms = [], 0
+    for delta, lane in zip(chart['t'], chart['l']):
+        ms += delta
+        notes.append({'time': ms / 1000, 'lane': int(lane)})
+    return notes
+
+
+def to_compact(beatmap):
+    compact = {'format': COMPACT_VERSION}
+    compact.update({k: v for k, v in beatmap.items() if k not in ('notes', 'charts')})
+    charts = {name: encode_chart(notes) for name, notes in beatmap.get('charts', {}).items()}
+    notes = encode_chart(beatmap.get('notes', []))
+    if charts:
+        compact['charts'] = charts
+    compact['notes'] = next((name for name, chart in charts.items() if chart == notes), notes)
+    return compact
+
+
+def from_compact(compact):
+    """Converte de volta para o formato JSON original (notes/charts como listas de notas)."""
+    beatmap = {k: v for k, v in compact.items() if k not in ('format', 'notes', 'charts')}
+    charts = {name: decode_chart(chart) for name, chart in compact.get('charts', {}).items()}
+    notes = compact.get('notes', {'t': [], 'l': ''})
+    beatmap['notes'] = charts[notes] if isinstance(notes, str) else decode_chart(notes)
+    if charts:
+        beatmap['charts'] = charts
+    return beatmap
+
+
+def dumps_compact(beatmap):
+    return json.dumps(to_compact(beatmap), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def compact_path(beatmaps_dir, song_id, encoding='identity'):
+    return os.path.join(beatmaps_dir, COMPACT_DIR_NAME, f"{song_id}.json{ENCODING_SUFFIXES[encoding]}")
+
+
+def _write_atomic(path, data):
+    # Nome único por chamada: threads do mesmo worker convertendo o mesmo
+    # beatmap ao mesmo tempo não podem dividir o arquivo temporário.
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.",
+                                     suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temporary, 0o644)  # O mkstemp cria com 0600.
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_compact(beatmap, beatmaps_dir, song_id):
+    """Grava a versão compacta e as irmãs pré-comprimidas (.gz e, se houver brotli, .br)."""
+    os.makedirs(os.path.join(beatmaps_dir, COMPACT_DIR_NAME), exist_ok=True)
+    data = dumps_compact(beatmap)
+    # As comprimidas vão primeiro: a identity por último marca o conjunto como atualizado.
+    _write_atomic(compact_path(beatmaps_dir, song_id, 'gzip'), gzip.compress(data, compresslevel=9, mtime=0))
+    br_path = compact_path(beatmaps_dir, song_id, 'br')
+    if brotli is not None:
+        _write_atomic(br_path, brotli.compress(data))
+    elif os.path.exists(br_path):
+        os.remove(br_path)  # Não deixa para trás um .br de uma versão anterior.
+    _write_atomic(compact_path(beatmaps_dir, song_id, 'identity'), data)
+
+
+def ensure_compact(beatmaps_dir, song_id):
+    """
+    Garante que a versão compacta existe e não é mais velha que o JSON
+    original, convertendo na hora beatmaps antigos ou editados à mão.
+    """
+    source = os.path.join(beatmaps_dir, f"{song_id}.json")
+    target = compact_path(beatmaps_dir, song_id)
+    try:
+        if os.stat(target).st_mtime_ns >= os.stat(source).st_mtime_ns:
+            return
+    except FileNotFoundError:
+        pass
+    with open(source, 'r', encoding='utf-8') as f:
+        beatmap = json.load(f)
+    write_compact(beatmap, beatmaps_dir, song_id)
+
+
+def available_encodings(beatmaps_dir, song_id):
+    return [encoding for encoding in ENCODING_SUFFIXES
+            if os.path.exists(compact_path(beatmaps_dir, song_id, encoding))]
@@ -0,0 +1,351 @@
+"""
+Benchmark reproduzível das rotas do Flask e da geração de beatmaps.
+
+Cria catálogos e bancos de pontuação sintéticos numa pasta temporária,
+mede latência (p50/p95/p99) e vazão pelo test client do Flask, o tempo de
+inicialização e a memória por worker, e grava tudo num JSON para comparar
+entre commits:
+
+    python benchmark.py --musicas 10,100,1000,10000 --pontuacoes 10000,1000000
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+# --- CONFIGURAÇÕES ---
+SEMENTE = 1234
+MUSICA_POPULAR = "Banda 0000 - Musica 0000"
+NOTAS_POR_BEATMAP = 600  # ~30 KB com indent=4, como os beatmaps reais
+
+
+def percentis(amostras_s):
+    ordenadas = sorted(amostras_s)
+
+    def p(q):
+        return ordenadas[min(len(ordenadas) - 1, int(round(q * (len(ordenadas) - 1))))] * 1000
+
+    return {"p50_ms": round(p(0.50), 3), "p95_ms": round(p(0.95), 3), "p99_ms": round(p(0.99), 3),
+            "max_ms": round(ordenadas[-1] * 1000, 3)}
+
+
+def medir(nome, parametros, funcao, repeticoes):
+    """Chama `funcao` várias vezes e devolve o resultado no formato do relatório."""
+    amostras = []
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        funcao()
+        amostras.append(time.perf_counter() - t0)
+    total = time.perf_counter() - inicio
+    resultado = {"nome": nome, "parametros": parametros, "repeticoes": repeticoes,
+                 "vazao_por_s": round(repeticoes / total, 1), **percentis(amostras)}
+    print(f"  {nome:<32} {json.dumps(parametros):<36} p50={resultado['p50_ms']:>9.3f} ms  "
+          f"p99={resultado['p99_ms']:>9.3f} ms  {resultado['vazao_por_s']:>9.1f}/s")
+    return resultado
+
+
+def checar(resposta, esperado=200):
+    if resposta.status_code != esperado:
+        raise RuntimeError(f"{resposta.request.path}: status {resposta.status_code}")
+
+
+# --- DADOS SINTÉTICOS ---
+
+def gerar_catalogo(pasta, total, rng):
+    """Completa a pasta até ter `total` beatmaps sintéticos."""
+    existentes = len([f for f in os.listdir(pasta) if f.endswith('.json')])
+    for i in range(existentes, total):
+        nome = f"Banda {i:04d} - Musica {i:04d}"
+        tempos = sorted(round(rng.uniform(1.5, 238.0), 3) for _ in range(NOTAS_POR_BEATMAP))
+        beatmap = {
+            "songName": f"Musica {i:04d}", "artist": f"Banda {i:04d}", "duration": "4:00", "bpm": 120,
+            "notes": [{"time": t, "lane": rng.randint(1, 4)} for t in tempos]
+        }
+        with open(os.path.join(pasta, f"{nome}.json"), 'w', encoding='utf-8') as f:
+            json.dump(beatmap, f, indent=4)
+
+
+def gerar_pontuacoes(db, score_model, total, musicas, rng, lote=50000):
+    """
+    Completa a tabela até ter `total` linhas. Metade vai para a música
+    popular, o resto se espalha pelo catálogo.
+    """
+    existentes = db.session.query(db.func.count(score_model.id)).scalar()
+    tabela = score_model.__table__
+    while existentes < total:
+        tamanho = min(lote, total - existentes)
+        linhas = [
+            {
+                "player_name": f"J{rng.randint(0, 99999):05d}",
+                "score_value": rng.randint(0, 200000),
+                "music_name": MUSICA_POPULAR if rng.random() < 0.5 else rng.choice(musicas),
+            }
+            for _ in range(tamanho)
+        ]
+        db.session.execute(tabela.insert(), linhas)
+        db.session.commit()
+        existentes += tamanho
+
+
+# --- CENÁRIOS ---
+
+def bench_catalogo(app_module, cliente, pasta, tamanhos, repeticoes, rng):
+    resultados = []
+    for total in tamanhos:
+        gerar_catalogo(pasta, total, rng)
+        app_module.catalog.invalidate()
+        t0 = time.perf_counter()
+        checar(cliente.get('/api/songs'))
+        frio = (time.perf_counter() - t0) * 1000
+        print(f"  GET /api/songs (catálogo frio)    {json.dumps({'musicas': total}):<36} {frio:.1f} ms")
+        resultados.append({"nome": "GET /api/songs (frio)", "parametros": {"musicas": total},
+                           "repeticoes": 1, "p50_ms": round(frio, 3)})
+        resultados.append(medir("GET /api/songs", {"musicas": total},
+                                lambda: checar(cliente.get('/api/songs')), repeticoes))
+    return resultados
+
+
+def bench_pontuacoes(app_module, flask_app, cliente, tamanhos, repeticoes, rng):
+    resultados = []
+    musicas = [m['id'] for m in app_module.catalog.songs()]
+    popular = MUSICA_POPULAR
+    for total in tamanhos:
+        with flask_app.app_context():
+            gerar_pontuacoes(app_module.db, app_module.Score, total, musicas, rng)
+        app_module.leaderboard.invalidate()
+        parametros = {"pontuacoes": total}
+        resultados.append(medir("GET /api/scores/<id>", parametros,
+                                lambda: checar(cliente.get(f'/api/scores/{popular}')), repeticoes))
+        resultados.append(medir("GET /api/scores/<id>/page", parametros,
+                                lambda: checar(cliente.get(f'/api/scores/{popular}/page')), repeticoes))
+        resultados.append(medir("GET /api/scores/<id>/rank", parametros,
+                                lambda: checar(cliente.get(f'/api/scores/{popular}/rank?score=100000')),
+                                repeticoes))
+        resultados.append(medir("GET /scores/<name>", parametros,
+                                lambda: checar(cliente.get(f'/scores/{popular}')), repeticoes))
+
+        def enviar():
+            corpo = {"name": "Bench", "score": rng.randint(0, 200000), "music": rng.choice(musicas)}
+            checar(cliente.post('/submit-score', json=corpo))
+
+        resultado = medir("POST /submit-score", parametros, enviar, repeticoes)
+        # A gravação é assíncrona: a vazão real inclui esvaziar a fila.
+        t0 = time.perf_counter()
+        app_module.score_writer.flush()
+        resultado["flush_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        resultados.append(resultado)
+    return resultados
+
+
+def memoria_processo():
+    """RSS, PSS e memória privada do processo atual em MB, lidos do /proc (só Linux)."""
+    try:
+        with open('/proc/self/smaps_rollup', encoding='ascii') as f:
+            campos = {linha.split(':')[0]: int(linha.split()[1]) for linha in f if linha.rstrip().endswith('kB')}
+    except OSError:
+        return None
+    return {"rss_mb": round(campos['Rss'] / 1024, 1), "pss_mb": round(campos['Pss'] / 1024, 1),
+            "privada_mb": round((campos['Private_Clean'] + campos['Private_Dirty']) / 1024, 1)}
+
+
+def atender(cliente, requisicoes):
+    """Faz requisições típicas e devolve quanto tempo levou a primeira."""
+    t0 = time.perf_counter()
+    checar(cliente.get('/api/songs'))
+    primeira = (time.perf_counter() - t0) * 1000
+    for _ in range(requisicoes - 1):
+        checar(cliente.get('/api/songs'))
+        checar(cliente.get(f'/api/scores/{MUSICA_POPULAR}'))
+    return primeira
+
+
+def sonda_inicializacao(preload):
+    """
+    Roda num processo novo (chamado pelo próprio benchmark) e imprime um JSON.
+    Com preload, imita o gunicorn --preload: o mestre monta o app e um worker
+    criado por fork atende as requisições; a memória privada desse worker é o
+    custo de cada worker a mais. Sem preload, o próprio processo monta o app e
+    atende, como um worker que inicia do zero.
+    """
+    t0 = time.perf_counter()
+    import app as app_module
+    t1 = time.perf_counter()
+    flask_app = app_module.create_app('production')
+    t2 = time.perf_counter()
+    resultado = {"import_ms": round((t1 - t0) * 1000, 1), "create_app_ms": round((t2 - t1) * 1000, 1)}
+    if not preload:
+        resultado["primeira_requisicao_ms"] = round(atender(flask_app.test_client(), 50), 1)
+        resultado["worker"] = memoria_processo()
+    elif hasattr(os, 'fork'):
+        resultado["mestre"] = memoria_processo()
+        leitura, escrita = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(leitura)
+                primeira = atender(flask_app.test_client(), 50)
+                os.write(escrita, json.dumps({"primeira_requisicao_ms": round(primeira, 1),
+                                              "worker": memoria_processo()}).encode())
+            finally:
+                os._exit(0)
+        os.close(escrita)
+        with os.fdopen(leitura) as f:
+            resultado.update(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    print(json.dumps(resultado))
+
+
+def mediana_por_campo(amostras):
+    """Mediana de cada número entre as amostras, inclusive dentro dos dicionários de memória."""
+    resultado = {}
+    for campo, valor in amostras[0].items():
+        if isinstance(valor, dict):
+            resultado[campo] = mediana_por_campo([a[campo] for a in amostras])
+        elif valor is None:
+            resultado[campo] = None
+        else:
+            resultado[campo] = sorted(a[campo] for a in amostras)[len(amostras) // 2]
+    return resultado
+
+
+def bench_inicializacao(repeticoes):
+    """Inicialização a frio e memória por worker, cada medida num processo novo."""
+    resultados = []
+    for preload in (False, True):
+        if preload and not hasattr(os, 'fork'):
+            print("  (sem fork nesta plataforma: pulando a medição com preload)")
+            continue
+        amostras = []
+        for _ in range(repeticoes):
+            saida = subprocess.run([sys.executable, os.path.abspath(__file__), '--sonda-inicializacao',
+                                    'preload' if preload else 'sem-preload'],
+                                   capture_output=True, text=True, check=True).stdout
+            amostras.append(json.loads(saida.strip().splitlines()[-1]))
+        mediana = mediana_por_campo(amostras)
+        nome = "inicialização (preload)" if preload else "inicialização (sem preload)"
+        resultados.append({"nome": nome, "parametros": {"preload": preload}, "repeticoes": repeticoes, **mediana})
+        memoria = mediana.get("worker") or {}
+        print(f"  {nome:<32} import={mediana['import_ms']:.0f} ms  create_app={mediana['create_app_ms']:.0f} ms  "
+              f"1ª requisição={mediana['primeira_requisicao_ms']:.1f} ms  "
+              f"worker privada={memoria.get('privada_mb', '?')} MB  pss={memoria.get('pss_mb', '?')} MB")
+    return resultados
+
+
+def bench_geracao(repeticoes, incluir_audio):
+    import numpy as np
+    import assistente_beatmaps as assistente
+
+    resultados = [
+        medir("gerar_notas_aleatorias", {"duracao_s": 240},
+              lambda: assistente.gerar_notas_aleatorias(240, assistente.DIFICULDADES_ALEATORIO["3"]),
+              repeticoes),
+        medir("gerar_charts_aleatorios", {"duracao_s": 240},
+              lambda: assistente.gerar_charts_aleatorios(240), repeticoes),
+    ]
+    if not incluir_audio:
+        return resultados
+    try:
+        import librosa
+        import soundfile as sf
+    except ImportError:
+        print("  (librosa/soundfile não instalados: pulando a análise de áudio)")
+        return resultados
+
+    with tempfile.TemporaryDirectory() as pasta:
+        sr, duracao = 22050, 60
+        rng = np.random.default_rng(SEMENTE)
+        y = librosa.clicks(times=np.sort(rng.uniform(0.5, duracao - 1, 2 * duracao)), sr=sr, length=sr * duracao)
+        caminho = os.path.join(pasta, "cliques.wav")
+        sf.write(caminho, y + 0.01 * rng.standard_normal(len(y)), sr)
+        dificuldade = assistente.DIFICULDADES_ANALISE["2"]
+        # A primeira chamada paga a compilação do numba; não entra na medição.
+        assistente.gerar_notas_com_librosa(caminho, dificuldade, usar_cache=False)
+        resultados.append(medir("gerar_notas_com_librosa", {"duracao_s": duracao, "cache": False},
+                                lambda: assistente.gerar_notas_com_librosa(caminho, dificuldade, usar_cache=False),
+                                max(1, repeticoes // 20)))
+    return resultados
+
+
+def versao_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lista_de_inteiros(texto):
+    return sorted(int(v) for v in texto.split(',') if v)
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Benchmark das rotas do Guitar Flask e da geração de beatmaps.")
+    parser.add_argument("--musicas", type=lista_de_inteiros, default=[10, 100, 1000],
+                        help="tamanhos de catálogo, separados por vírgula (padrão: 10,100,1000; aceita até 10000+)")
+    parser.add_argument("--pontuacoes", type=lista_de_inteiros, default=[10000, 100000, 1000000],
+                        help="tamanhos da tabela de pontuações (padrão: 10000,100000,1000000)")
+    parser.add_argument("--repeticoes", type=int, default=200, help="requisições por medição (padrão: 200)")
+    parser.add_argument("--sem-audio", action="store_true", help="não mede a análise com librosa")
+    parser.add_argument("--saida", default="benchmark_resultados.json", help="arquivo JSON com os resultados")
+    parser.add_argument("--inicializacoes", type=int, default=5,
+                        help="processos novos por medição de inicialização (padrão: 5)")
+    parser.add_argument("--sonda-inicializacao", choices=["preload", "sem-preload"], help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    if args.sonda_inicializacao:
+        sonda_inicializacao(args.sonda_inicializacao == 'preload')
+        return 0
+    rng = random.Random(SEMENTE)
+    pasta = tempfile.mkdtemp(prefix="guitarflask-bench-")
+    pasta_beatmaps = os.path.join(pasta, "beatmaps")
+    os.makedirs(pasta_beatmaps)
+    # O app lê essas variáveis ao ser importado.
+    os.environ['GUITARFLASK_DATABASE_URI'] = 'sqlite:///' + os.path.join(pasta, 'bench.db')
+    os.environ['GUITARFLASK_BEATMAPS_DIR'] = pasta_beatmaps
+
+    try:
+        import app as app_module
+        flask_app = app_module.create_app('production')
+        cliente = flask_app.test_client()
+
+        resultados = []
+        print("--- Catálogo ---")
+        resultados += bench_catalogo(app_module, cliente, pasta_beatmaps, args.musicas, args.repeticoes, rng)
+        print("--- Pontuações ---")
+        resultados += bench_pontuacoes(app_module, flask_app, cliente, args.pontuacoes, args.repeticoes, rng)
+        print("--- Inicialização e memória ---")
+        resultados += bench_inicializacao(args.inicializacoes)
+        print("--- Geração de beatmaps ---")
+        resultados += bench_geracao(args.repeticoes, not args.sem_audio)
+        app_module.score_writer.close()
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    relatorio = {
+        "commit": versao_git(),
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "plataforma": platform.platform(),
+        "processador": platform.processor() or platform.machine(),
+        "parametros": {"musicas": args.musicas, "pontuacoes": args.pontuacoes, "repeticoes": args.repeticoes,
+                       "inicializacoes": args.inicializacoes},
+        "resultados": resultados,
+    }
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados gravados em '{args.saida}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# --- CONFIGURAÇÕES ---
+PASTA_CACHE = os.path.join('.cache', 'analise')
+LIMITE_CACHE_BYTES = 512 * 1024 * 1024
+
+# Cache em disco do resultado da análise de áudio (envelope de onsets, onsets
+# e batidas). A chave combina o hash do conteúdo do MP3 com os parâmetros da
+# análise, então trocar a dificuldade ou a regra das pistas reaproveita o
+# resultado, enquanto trocar o arquivo de áudio ou os parâmetros não.
+
+def hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def chave_cache(hash_audio, parametros):
+    texto = hash_audio + json.dumps(parametros, sort_keys=True)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+def caminho_entrada(chave, pasta=PASTA_CACHE):
+    return os.path.join(pasta, f"{chave}.npz")
+
+def carregar(chave, pasta=PASTA_CACHE):
+    """Devolve o dicionário de arrays guardado para a chave, ou None se não houver."""
+    caminho = caminho_entrada(chave, pasta)
+    try:
+        with np.load(caminho) as dados:
+            resultado = {nome: dados[nome] for nome in dados.files}
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(caminho)  # Marca como usado recentemente (LRU pelo mtime).
+    except OSError:
+        pass
+    return resultado
+
+def salvar(chave, dados, pasta=PASTA_CACHE, limite_bytes=LIMITE_CACHE_BYTES):
+    os.makedirs(pasta, exist_ok=True)
+    caminho = caminho_entrada(chave, pasta)
+    # Grava num temporário e troca de uma vez: vários processos do lote podem
+    # estar lendo e escrevendo a mesma pasta.
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, 'wb') as f:
+        np.savez_compressed(f, **dados)
+    os.replace(temporario, caminho)
+    limpar(pasta, limite_bytes)
+
+def limpar(pasta=PASTA_CACHE, limite_bytes=LIMITE_CACHE_BYTES):
+    """Remove as entradas usadas há mais tempo até o cache caber no limite."""
+    entradas = []
+    with os.scandir(pasta) as it:
+        for entrada in it:
+            if entrada.name.endswith('.npz'):
+                try:
+                    stat = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                entradas.append((stat.st_mtime, stat.st_size, entrada.path))
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, caminho in sorted(entradas):
+        if total <= limite_bytes:
+            break
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+        total -= tamanho
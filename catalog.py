@@ -0,0 +1,107 @@
+import os
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SongCatalog:
+    """
+    Índice em memória dos beatmaps: guarda só os metadados de cada música
+    e relê do disco apenas os arquivos cujo mtime/tamanho mudou.
+    """
+
+    def __init__(self, beatmaps_dir=None, check_interval=2.0):
+        self.beatmaps_dir = beatmaps_dir
+        self.check_interval = check_interval
+        self._entries = {}
+        self._song_list = []
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        # Contadores para a instrumentação: consultas ao índice, varreduras da
+        # pasta e, em cada varredura, entradas reaproveitadas x relidas do disco.
+        self.lookups = 0
+        self.scans = 0
+        self.entry_hits = 0
+        self.entry_misses = 0
+
+    def init_app(self, app):
+        """Usa a pasta de beatmaps configurada no app (BEATMAPS_DIR)."""
+        self.beatmaps_dir = app.config['BEATMAPS_DIR']
+        self.invalidate()
+
+    def songs(self):
+        """Lista de metadados de todas as músicas, ordenada pelo id."""
+        self.refresh()
+        self.lookups += 1
+        return self._song_list
+
+    def get(self, song_id):
+        """Metadados de uma música, ou None se o beatmap não existir."""
+        self.refresh()
+        self.lookups += 1
+        entry = self._entries.get(song_id)
+        return entry['meta'] if entry else None
+
+    def invalidate(self, song_id=None):
+        """Força a releitura de uma música (ou do catálogo inteiro) na próxima consulta."""
+        with self._lock:
+            if song_id is None:
+                self._entries = {}
+            else:
+                self._entries = {k: v for k, v in self._entries.items() if k != song_id}
+            self._last_check = 0.0
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if not force and now - self._last_check < self.check_interval:
+                return
+            self._scan()
+            self._last_check = time.monotonic()
+
+    def _scan(self):
+        # Monta um dicionário novo e troca de uma vez, para que leitores
+        # concorrentes nunca vejam o índice pela metade.
+        self.scans += 1
+        entries = {}
+        with os.scandir(self.beatmaps_dir) as it:
+            for dir_entry in it:
+                name = dir_entry.name
+                if not name.endswith('.json') or name.startswith('.') or not dir_entry.is_file():
+                    continue
+                song_id = name.rsplit('.', 1)[0]
+                stat = dir_entry.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+                cached = self._entries.get(song_id)
+                if cached and cached['signature'] == signature:
+                    entries[song_id] = cached
+                    self.entry_hits += 1
+                    continue
+                try:
+                    meta = self._read_meta(song_id, dir_entry.path)
+                except (OSError, ValueError) as e:
+                    logger.error("Erro ao ler o beatmap '%s': %s", name, e)
+                    continue
+                self.entry_misses += 1
+                entries[song_id] = {'signature': signature, 'meta': meta}
+        self._entries = entries
+        self._song_list = [entry['meta'] for _, entry in sorted(entries.items())]
+
+    @staticmethod
+    def _read_meta(song_id, filepath):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {
+            'id': song_id,
+            'songName': data.get('songName', 'Nome Desconhecido'),
+            'artist': data.get('artist', 'Artista Desconhecido'),
+            'duration': data.get('duration'),
+            'bpm': data.get('bpm'),
+            'noteCount': len(data.get('notes', [])),
+            'difficulties': list(data.get('charts', {})),
+        }
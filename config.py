@@ -0,0 +1,67 @@
+import os
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+def _env_float(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'GUITARFLASK_DATABASE_URI', 'sqlite:///' + os.path.join(basedir, 'scores.db'))
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    BEATMAPS_DIR = os.environ.get('GUITARFLASK_BEATMAPS_DIR', os.path.join(basedir, 'static', 'beatmaps'))
+    AUDIO_DIR = os.path.join(basedir, 'static', 'audio')
+    # Envio de MP3s pelo /api/songs/upload.
+    MAX_CONTENT_LENGTH = 64 * 1024 * 1024
+    # Processos da fila de geração de beatmaps (None: um por núcleo).
+    BEATMAP_WORKERS = int(os.environ.get('GUITARFLASK_BEATMAP_WORKERS', '0')) or None
+    # Perfil opcional das requisições lentas: defina o limite em ms para ligar.
+    PROFILE_SLOW_REQUEST_MS = _env_float('GUITARFLASK_PROFILE_SLOW_MS')
+    PROFILE_SAMPLE_RATE = _env_float('GUITARFLASK_PROFILE_SAMPLE_RATE') or 0.1
+    # Aquecer os caches (catálogo e hashes dos áudios) já no create_app.
+    WARM_CACHES = False
+    # De quanto em quanto tempo o top-10 em memória procura pontuações
+    # gravadas por outros processos. None: só este processo grava.
+    LEADERBOARD_SYNC_INTERVAL = None
+    # /api/scores/<música>/stream: comentário a cada tantos segundos para a
+    # conexão não cair por inatividade, e tempo máximo de cada conexão (o
+    # navegador reconecta), para não prender uma thread para sempre.
+    LEADERBOARD_STREAM_KEEPALIVE = 15
+    LEADERBOARD_STREAM_SECONDS = 300
+    # Compactação das pontuações (flask compact-scores): guarda o top N de
+    # cada música e o recorde pessoal de cada jogador, em lotes com uma
+    # pausa entre eles para a fila de gravação não esperar.
+    SCORE_RETAIN_TOP = 100
+    SCORE_COMPACT_BATCH = 500
+    SCORE_COMPACT_PAUSE = 0.05
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    DEBUG = False
+    WARM_CACHES = True
+    LEADERBOARD_SYNC_INTERVAL = 1.0
+    # Cada worker web tem a sua fila de geração: divide os núcleos entre eles.
+    WEB_WORKERS = int(os.environ.get('GUITARFLASK_WORKERS', os.cpu_count() or 1))
+    BEATMAP_WORKERS = Config.BEATMAP_WORKERS or max(1, (os.cpu_count() or 1) // WEB_WORKERS)
+    # Cada worker do gunicorn atende GUITARFLASK_THREADS requisições ao mesmo
+    # tempo e ainda tem a thread de gravação das pontuações: uma conexão para
+    # cada, mais uma folga pequena. No SQLite, conexões demais só disputam o lock.
+    THREADS = int(os.environ.get('GUITARFLASK_THREADS', '4'))
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': THREADS + 1,
+        'max_overflow': 2,
+        'pool_timeout': 10,
+    }
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+}
@@ -0,0 +1,25 @@
+import os
+import multiprocessing
+
+# Configuração do gunicorn para produção (gunicorn -c gunicorn.conf.py).
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('GUITARFLASK_BIND', '0.0.0.0:8000')
+
+# O SQLite aceita um escritor por vez: mais workers ajudam nas leituras, mas
+# além do número de núcleos só aumentam a disputa pelo lock de escrita.
+workers = int(os.environ.get('GUITARFLASK_WORKERS', multiprocessing.cpu_count()))
+# Cada conexão de /api/scores/<música>/stream ocupa uma thread do gthread
+# enquanto estiver aberta. Para telões com muitas conexões ao vivo, use
+# GUITARFLASK_WORKER_CLASS=gevent (pip install gevent).
+worker_class = os.environ.get('GUITARFLASK_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUITARFLASK_THREADS', '4'))  # Também dimensiona o pool de conexões.
+
+# Carrega o app (esquema, catálogo, hashes dos áudios) uma vez no mestre;
+# os workers herdam o estado pronto no fork e começam a atender na hora.
+preload_app = True
+
+
+def worker_exit(server, worker):
+    # Grava as pontuações ainda na fila antes de o worker sair.
+    from app import score_writer
+    score_writer.close()
@@ -0,0 +1,146 @@
+import os
+import queue
+import threading
+import time
+import atexit
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ScoreWriter:
+    """
+    Gravação em segundo plano (write-behind) das pontuações: as requisições só
+    enfileiram, e uma thread grava em lotes, com um único commit por lote.
+    O lote fecha ao atingir `batch_size` itens ou `max_delay` segundos.
+    """
+
+    def __init__(self, write_batch, app=None, max_queue=10000, batch_size=200, max_delay=0.05):
+        self.app = app
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def init_app(self, app):
+        self.app = app
+
+    def submit(self, item):
+        """Enfileira uma pontuação. Retorna False se a fila estiver cheia."""
+        return self.submit_many([item])
+
+    def submit_many(self, items):
+        """Enfileira várias pontuações de uma vez; recusa todas se não couberem."""
+        if self._closed:
+            return False
+        self._ensure_started()
+        # A conferência e os put_nowait ficam sob a mesma trava: dois envios
+        # em lote ao mesmo tempo não passam os dois pela conferência, e uma
+        # requisição nunca fica bloqueada esperando espaço na fila.
+        with self._submit_lock:
+            if self._queue.maxsize and self._queue.qsize() + len(items) > self._queue.maxsize:
+                return False
+            try:
+                for item in items:
+                    self._queue.put_nowait(item)
+            except queue.Full:
+                return False
+        return True
+
+    def accepting(self):
+        """Se ainda há espaço na fila para novas pontuações."""
+        return not self._closed and (not self._queue.maxsize or self._queue.qsize() < self._queue.maxsize)
+
+    def pending(self):
+        """Quantas pontuações ainda aguardam gravação."""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Bloqueia até que tudo o que já foi enfileirado esteja gravado."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Grava o que estiver pendente e encerra a thread (chamado no desligamento)."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _ensure_started(self):
+        # Threads não sobrevivem a um fork: cada processo inicia a sua.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='score-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+        # Depois do sinal de parada, grava o que ainda estiver na fila.
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.task_done()
+            else:
+                leftovers.append(item)
+        if leftovers:
+            self._write(leftovers)
+
+    def _write(self, batch):
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.exception("Erro ao gravar a pontuação %r: %s", batch[0], e)
+            else:
+                # Uma linha ruim não pode levar as outras junto: o lote já foi
+                # desfeito (o app context remove a sessão), grava uma a uma.
+                logger.warning("Erro ao gravar um lote de %d pontuações (%s); gravando uma a uma",
+                               len(batch), e)
+                for item in batch:
+                    try:
+                        self._write_batch([item])
+                    except Exception as e:
+                        logger.exception("Erro ao gravar a pontuação %r: %s", item, e)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_batch(self, batch):
+        with self.app.app_context():
+            self.write_batch(batch)
@@ -0,0 +1,90 @@
+import os
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_worker():
+    # Roda uma vez em cada processo do pool: importa o librosa e compila as
+    # funções do numba antes do primeiro job, em vez de cobrar isso dele.
+    import assistente_beatmaps
+    assistente_beatmaps.aquecer()
+
+
+def _run_job(kwargs):
+    import assistente_beatmaps
+    return assistente_beatmaps.processar_musica(**kwargs)
+
+
+class BeatmapJobQueue:
+    """
+    Fila de geração de beatmaps: um pool de processos de longa duração, com
+    o librosa já importado e aquecido, executa os jobs; `on_finish(job_id,
+    resumo)` é chamado dentro de um app context quando cada um termina.
+    O pool só é criado no primeiro job e pertence ao processo que o criou.
+    """
+
+    def __init__(self, on_finish, app=None, workers=None):
+        self.on_finish = on_finish
+        self.app = app
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('BEATMAP_WORKERS') or os.cpu_count() or 1
+
+    def submit(self, job_id, **kwargs):
+        """Manda um job para o pool; o resultado chega depois pelo on_finish."""
+        try:
+            future = self._get_executor().submit(_run_job, kwargs)
+        except BrokenProcessPool:
+            # Um processo do pool morreu (ex: falta de memória): recria e tenta de novo.
+            self._discard_executor()
+            future = self._get_executor().submit(_run_job, kwargs)
+        future.add_done_callback(lambda f: self._finished(job_id, f))
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # spawn: o servidor web tem threads, e um fork no meio delas
+                # pode herdar locks presos.
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_warm_worker)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _finished(self, job_id, future):
+        if future.cancelled():
+            resumo = {"ok": False, "erro": "Cancelado no desligamento do servidor"}
+        elif future.exception() is not None:
+            e = future.exception()
+            resumo = {"ok": False, "erro": f"{type(e).__name__}: {e}"}
+        else:
+            resumo = future.result()
+        try:
+            with self.app.app_context():
+                self.on_finish(job_id, resumo)
+        except Exception:
+            logger.exception("Erro ao registrar o fim do job %s", job_id)
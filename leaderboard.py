@@ -0,0 +1,128 @@
+import time
+import bisect
+import threading
+
+
+class LeaderboardCache:
+    """
+    Guarda em memória o top-N de cada música. A primeira leitura carrega do
+    banco; depois disso cada pontuação nova é encaixada incrementalmente.
+
+    Com vários processos (workers do gunicorn), cada um tem o seu cache e só
+    vê as próprias gravações. Com `fetch_since` e `sync_interval`, o cache
+    procura de tempos em tempos as linhas com id acima do último visto.
+
+    Cada mudança no top de uma música aumenta a versão dela e acorda quem
+    está em `wait_for_change` (as conexões de /api/scores/<música>/stream).
+    """
+
+    def __init__(self, loader, size=10, fetch_since=None, sync_interval=None, sync_batch=1000):
+        self.size = size
+        self._loader = loader
+        self._boards = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._fetch_since = fetch_since
+        self.sync_interval = sync_interval
+        self.sync_batch = sync_batch
+        self._last_id = None
+        self._last_sync = 0.0
+        self._sync_lock = threading.Lock()
+        self._versions = {}
+        self._changed = threading.Condition(self._lock)
+
+    def top(self, music_name):
+        """Top-N da música como lista de dicts, do maior para o menor."""
+        self.sync()
+        board = self._boards.get(music_name)
+        if board is None:
+            with self._lock:
+                board = self._boards.get(music_name)
+                if board is None:
+                    self.misses += 1
+                    rows = self._loader(music_name, self.size)
+                    board = [(-s.score_value, s.id, s.player_name) for s in rows]
+                    self._boards[music_name] = board
+        else:
+            self.hits += 1
+        return [
+            {'rank': i + 1, 'id': score_id, 'player_name': name, 'score_value': -neg_value}
+            for i, (neg_value, score_id, name) in enumerate(board)
+        ]
+
+    def offer(self, music_name, score_id, player_name, score_value):
+        """
+        Encaixa uma pontuação recém-salva. Retorna True se o ranking mudou.
+        Empates ficam com quem pontuou primeiro (menor id).
+        """
+        key = (-score_value, score_id, player_name)
+        with self._lock:
+            board = self._boards.get(music_name)
+            if board is None:
+                return False  # Ainda não foi carregado: a próxima leitura já virá do banco.
+            if len(board) >= self.size and key >= board[-1]:
+                return False
+            i = bisect.bisect_left(board, key)
+            if i < len(board) and board[i] == key:
+                return False  # Já está no ranking (veio do banco ou de uma sincronização).
+            board = list(board)
+            bisect.insort(board, key)
+            self._boards[music_name] = board[:self.size]
+            self._bump(music_name)
+            return True
+
+    def sync(self, force=False):
+        """
+        Encaixa as pontuações gravadas por outros processos desde a última
+        sincronização. `fetch_since(after_id, limit)` devolve (linhas com id
+        acima de after_id em ordem de id, maior id da tabela).
+        """
+        if self._fetch_since is None or (self.sync_interval is None and not force):
+            return
+        if not force and time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return  # Outra thread já está sincronizando.
+        try:
+            rows, latest_id = self._fetch_since(self._last_id, self.sync_batch)
+            if self._last_id is None or (rows and rows[-1].id < latest_id):
+                # Primeira sincronização (nada garante o que já foi carregado) ou
+                # atrasado demais: mais barato recarregar sob demanda.
+                self.invalidate()
+            else:
+                for s in rows:
+                    self.offer(s.music_name, s.id, s.player_name, s.score_value)
+            self._last_id = latest_id
+            self._last_sync = time.monotonic()
+        finally:
+            self._sync_lock.release()
+
+    def invalidate(self, music_name=None):
+        with self._lock:
+            if music_name is None:
+                self._boards = {}
+                for name in self._versions:
+                    self._bump(name)
+            else:
+                self._boards.pop(music_name, None)
+                self._bump(music_name)
+
+    def version(self, music_name):
+        return self._versions.get(music_name, 0)
+
+    def wait_for_change(self, music_name, version, timeout):
+        """
+        Espera (até `timeout` segundos) o top da música passar da versão
+        `version` e devolve a versão atual. Todas as conexões esperam na
+        mesma Condition: uma mudança acorda todas de uma vez, e cada uma só
+        confere a versão da sua música, sem tocar no banco.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._versions.get(music_name, 0) != version, timeout)
+            return self._versions.get(music_name, 0)
+
+    def _bump(self, music_name):
+        # Chamado com self._lock (o mesmo da Condition) já adquirido.
+        self._versions[music_name] = self._versions.get(music_name, 0) + 1
+        self._changed.notify_all()
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+
+# --- CONFIGURAÇÕES ---
+NOME_ARQUIVO = '.manifest.json'  # Começa com ponto: o catálogo do servidor ignora.
+VERSAO_MANIFESTO = 1
+ESPERA_TRAVA_SEGUNDOS = 30
+
+# Manifesto dos beatmaps gerados: para cada música, o hash do MP3 de origem e
+# os parâmetros da geração (modo, dificuldade, semente, versão do gerador).
+# Comparando com o estado atual, o assistente refaz só o que mudou. O
+# servidor (fila de jobs) e o assistente podem gravar ao mesmo tempo, então
+# toda gravação relê o arquivo e aplica só as próprias mudanças, com trava.
+
+def caminho(pasta_beatmaps):
+    return os.path.join(pasta_beatmaps, NOME_ARQUIVO)
+
+def carregar(pasta_beatmaps):
+    """Entradas do manifesto por música (vazio se o arquivo não existir ou estiver corrompido)."""
+    try:
+        with open(caminho(pasta_beatmaps), 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if dados.get("versao") != VERSAO_MANIFESTO:
+        return {}
+    return dados.get("musicas", {})
+
+@contextmanager
+def _travar(pasta_beatmaps):
+    # Arquivo de trava criado com O_EXCL: funciona igual no Linux e no Windows.
+    trava = caminho(pasta_beatmaps) + '.lock'
+    inicio = time.monotonic()
+    while True:
+        try:
+            os.close(os.open(trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(trava).st_mtime > ESPERA_TRAVA_SEGUNDOS:
+                    os.remove(trava)  # Sobrou de um processo que morreu.
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() - inicio > ESPERA_TRAVA_SEGUNDOS:
+                raise TimeoutError(f"Manifesto travado por outro processo: '{trava}'")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(trava)
+        except FileNotFoundError:
+            pass
+
+def atualizar(pasta_beatmaps, mudancas):
+    """
+    Aplica {música: entrada} no manifesto (entrada None remove a música) e
+    devolve o manifesto completo já atualizado.
+    """
+    with _travar(pasta_beatmaps):
+        musicas = carregar(pasta_beatmaps)
+        for nome, entrada in mudancas.items():
+            if entrada is None:
+                musicas.pop(nome, None)
+            else:
+                musicas[nome] = entrada
+        destino = caminho(pasta_beatmaps)
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({"versao": VERSAO_MANIFESTO, "musicas": musicas}, f, indent=1, sort_keys=True,
+                      ensure_ascii=False)
+        os.replace(temporario, destino)
+    return musicas
+
+def assinatura(stat):
+    return [stat.st_mtime_ns, stat.st_size]
+
+def hash_do_audio(caminho_mp3, entrada=None, stat=None):
+    """
+    Hash do conteúdo do MP3. Se mtime e tamanho são os mesmos da entrada do
+    manifesto, reaproveita o hash gravado em vez de ler o arquivo de novo.
+    """
+    import cache_analise  # Traz o numpy; o servidor só usa atualizar().
+    stat = stat or os.stat(caminho_mp3)
+    if entrada and entrada.get("assinatura") == assinatura(stat):
+        return entrada["hash_audio"]
+    return cache_analise.hash_arquivo(caminho_mp3)
+
+def nova_entrada(caminho_mp3, hash_audio, modo, chave_dificuldade, seed, versao_gerador, stat=None):
+    stat = stat or os.stat(caminho_mp3)
+    return {
+        "hash_audio": hash_audio, "assinatura": assinatura(stat),
+        "modo": modo, "dificuldade": chave_dificuldade, "seed": seed, "versao_gerador": versao_gerador,
+        "gerado_em": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
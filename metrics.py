@@ -0,0 +1,209 @@
+import os
+import time
+import random
+import logging
+import cProfile
+import threading
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Limites (em segundos) dos baldes dos histogramas de latência.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name, self.help_text, self.labelnames = name, help_text, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help_text, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [contagem por balde..., soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, ("le", bound))} {count}')
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, ("le", "+Inf"))} {series[-1]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-2]}')
+                lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}')
+        return lines
+
+
+class Callback:
+    """Métrica cujo valor é lido na hora da coleta (ex: contadores mantidos pelo catálogo)."""
+
+    def __init__(self, name, help_text, read, kind='gauge'):
+        self.name, self.help_text, self.read, self.kind = name, help_text, read, kind
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}',
+                f'{self.name} {self.read()}']
+
+
+class Metrics:
+    """
+    Instrumentação embutida: latência por rota, consultas SQL por requisição
+    (eventos do SQLAlchemy), tempo de renderização dos templates e métricas
+    extras registradas pelo app. Exposta em texto no formato do Prometheus.
+    """
+
+    def __init__(self):
+        self.requests = Counter('guitarflask_http_requests_total', 'Requisições atendidas.',
+                                ('method', 'route', 'status'))
+        self.latency = Histogram('guitarflask_http_request_duration_seconds', 'Latência das requisições.',
+                                 ('method', 'route'))
+        self.sql_per_request = Histogram('guitarflask_sql_queries_per_request', 'Consultas SQL por requisição.',
+                                         ('route',), buckets=COUNT_BUCKETS)
+        self.sql_time_per_request = Histogram('guitarflask_sql_duration_per_request_seconds',
+                                              'Tempo total em SQL por requisição.', ('route',))
+        self.sql_latency = Histogram('guitarflask_sql_query_duration_seconds',
+                                     'Duração de cada consulta SQL (inclui a thread de gravação).')
+        self.template_latency = Histogram('guitarflask_template_render_duration_seconds',
+                                          'Tempo de renderização dos templates.', ('template',))
+        self.collectors = [self.requests, self.latency, self.sql_per_request, self.sql_time_per_request,
+                           self.sql_latency, self.template_latency]
+        self.profile_dir = None
+        self.profile_slow_ms = None
+        self.profile_sample_rate = 0.0
+        self._engine_hooked = False
+
+    def register(self, collector):
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for collector in self.collectors:
+            lines.extend(collector.render())
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, app):
+        self.profile_slow_ms = app.config.get('PROFILE_SLOW_REQUEST_MS')
+        self.profile_sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.1)
+        self.profile_dir = app.config.get('PROFILE_DIR', os.path.join(app.root_path, 'profiles'))
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        # Os eventos valem para todas as engines do processo: registra uma vez só,
+        # mesmo que create_app seja chamado de novo (ex: no reloader ou em testes).
+        if not self._engine_hooked:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._engine_hooked = True
+
+    # --- Requisições ---
+
+    @staticmethod
+    def _route():
+        return request.url_rule.rule if request.url_rule else '<sem rota>'
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+        g.profiler = None
+        if self.profile_slow_ms is not None and random.random() < self.profile_sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.profiler = profiler
+            except ValueError:
+                pass  # Outro profiler já ativo nesta thread.
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        route = self._route()
+        status = g.pop('metrics_status', 500)
+        self.requests.inc(request.method, route, status)
+        self.latency.observe(elapsed, request.method, route)
+        self.sql_per_request.observe(g.get('sql_count', 0), route)
+        self.sql_time_per_request.observe(g.get('sql_time', 0.0), route)
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            if elapsed * 1000 >= self.profile_slow_ms:
+                self._dump_profile(profiler, route, elapsed)
+
+    def _dump_profile(self, profiler, route, elapsed):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        safe_route = ''.join(c if c.isalnum() else '_' for c in route).strip('_') or 'raiz'
+        path = os.path.join(self.profile_dir,
+                            f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_route}-{elapsed * 1000:.0f}ms.prof")
+        profiler.dump_stats(path)
+        logger.warning("Requisição lenta em %s (%.0f ms); perfil salvo em %s", route, elapsed * 1000, path)
+
+    # --- Templates ---
+
+    def _before_render(self, sender, template, context, **extra):
+        if has_request_context():
+            g.template_start = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        if has_request_context() and 'template_start' in g:
+            self.template_latency.observe(time.perf_counter() - g.pop('template_start'), template.name)
+
+    # --- SQL ---
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('metrics_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        self.sql_latency.observe(elapsed)
+        if has_request_context() and 'sql_count' in g:
+            g.sql_count += 1
+            g.sql_time += elapsed
@@ -0,0 +1,52 @@
+import logging
+from sqlalchemy import text
+import aggregates
+
+logger = logging.getLogger(__name__)
+
+# Cada posição é uma versão do esquema (guardada em PRAGMA user_version).
+# Bancos novos já nascem com tudo via db.create_all(); estes passos existem
+# para atualizar arquivos scores.db criados por versões anteriores. Um passo
+# é um comando SQL ou uma função que recebe a conexão.
+
+
+def add_column(table, column, definition):
+    """Passo que adiciona a coluna, se o create_all ainda não a criou."""
+    def step(conn):
+        columns = [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))]
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+    return step
+
+
+MIGRATIONS = [
+    # 1: índice composto para os rankings por música
+    [
+        "CREATE INDEX IF NOT EXISTS ix_score_music_value ON score (music_name, score_value DESC)",
+    ],
+    # 2: índice do recorde pessoal (compactação das pontuações)
+    [
+        "CREATE INDEX IF NOT EXISTS ix_score_music_player_value ON score (music_name, player_name, score_value DESC)",
+    ],
+    # 3: ranking geral (as tabelas vêm do db.create_all; aqui só são preenchidas)
+    aggregates.REBUILD_STATEMENTS,
+    # 4: maior pontuação arquivada de cada música (posição no ranking depois da compactação)
+    [
+        add_column('score_summary', 'max_value', 'INTEGER'),
+    ],
+]
+
+
+def upgrade(engine):
+    """Aplica as migrações pendentes e retorna a versão final do esquema."""
+    with engine.begin() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            conn.execute(text(f"PRAGMA user_version = {number}"))
+            logger.info("Migração do banco aplicada: versão %d", number)
+    return max(version, len(MIGRATIONS))
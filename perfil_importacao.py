@@ -0,0 +1,66 @@
+"""
+Relatório do tempo de importação dos módulos, a partir do `python -X importtime`
+(cada medição roda num processo novo, sem nada já importado):
+
+    python perfil_importacao.py app assistente_beatmaps
+"""
+import sys
+import subprocess
+
+# --- CONFIGURAÇÕES ---
+MAIS_LENTOS = 15
+
+
+def medir_importacao(codigo):
+    """
+    Roda `codigo` num interpretador novo com -X importtime e devolve (total em
+    ms, [(ms acumulados, pacote), ...] do mais lento ao mais rápido), onde os
+    pacotes são os importados pelos módulos que o código importa.
+    """
+    inicializacao = {nome for nivel, nome, _ in _importacoes('pass') if nivel == 0}
+    total, pacotes, filhos = 0.0, {}, []
+    for nivel, nome, ms in _importacoes(codigo):
+        if nivel == 1:
+            filhos.append((nome, ms))
+        elif nivel == 0:
+            # O importtime imprime as dependências antes de quem as importou.
+            if nome not in inicializacao:
+                total += ms
+                for filho, ms_filho in filhos or [(nome, ms)]:
+                    pacote = filho.split('.')[0]
+                    pacotes[pacote] = pacotes.get(pacote, 0) + ms_filho
+            filhos = []
+    return total, sorted(((ms, nome) for nome, ms in pacotes.items()), reverse=True)
+
+
+def _importacoes(codigo):
+    """(nível de aninhamento, módulo, ms acumulados) de cada linha do -X importtime."""
+    resultado = subprocess.run([sys.executable, '-X', 'importtime', '-c', codigo],
+                               capture_output=True, text=True, check=True)
+    importacoes = []
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith('import time:') or 'cumulative' in linha:
+            continue
+        _, acumulado, nome = linha.split('|')
+        nivel = (len(nome) - len(nome.lstrip()) - 1) // 2
+        importacoes.append((nivel, nome.strip(), int(acumulado) / 1000))
+    return importacoes
+
+
+def imprimir_relatorio(titulo, codigo, mais_lentos=MAIS_LENTOS):
+    total, pacotes = medir_importacao(codigo)
+    print(f"\n{titulo}: {total:.0f} ms importando módulos")
+    for ms, nome in pacotes[:mais_lentos]:
+        print(f"  {ms:>8.1f} ms  {nome}")
+    return total
+
+
+def main(argv=None):
+    modulos = (argv if argv is not None else sys.argv[1:]) or ['app', 'assistente_beatmaps']
+    for modulo in modulos:
+        imprimir_relatorio(f"import {modulo}", f"import {modulo}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
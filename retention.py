@@ -0,0 +1,68 @@
+import json
+import bisect
+
+# Histograma das pontuações arquivadas: baldes exatos até 64 e, daí para
+# cima, 32 baldes por potência de 2 (erro relativo abaixo de 1/32). A chave
+# de cada balde é o seu limite inferior, e a largura sai da própria chave,
+# então o formato não depende de saber a pontuação máxima da música.
+SUB_BUCKETS_BITS = 5
+EXACT_BELOW = 2 << SUB_BUCKETS_BITS
+
+
+def _shift(value):
+    return max(0, value.bit_length() - SUB_BUCKETS_BITS - 1) if value >= EXACT_BELOW else 0
+
+
+def bucket_of(value):
+    """Limite inferior do balde onde `value` cai."""
+    shift = _shift(value)
+    return (value >> shift) << shift
+
+
+def bucket_width(lower):
+    return 1 << _shift(lower)
+
+
+def load_histogram(raw):
+    """JSON gravado no banco -> {limite inferior: quantidade}."""
+    return {int(k): v for k, v in json.loads(raw).items()} if raw else {}
+
+
+def dump_histogram(histogram):
+    return json.dumps({str(k): v for k, v in sorted(histogram.items())}, separators=(',', ':'))
+
+
+def add_to_histogram(histogram, values):
+    for value in values:
+        lower = bucket_of(value)
+        histogram[lower] = histogram.get(lower, 0) + 1
+    return histogram
+
+
+def count_below(histogram, value, highest=None):
+    """
+    Quantas pontuações do histograma ficam abaixo de `value`. Dentro do
+    balde de `value` supõe as pontuações espalhadas por igual; `highest`, a
+    maior pontuação do histograma, encurta o último balde até ela.
+    """
+    lowers = sorted(histogram)
+    i = bisect.bisect_right(lowers, value)
+    below = sum(histogram[k] for k in lowers[:max(0, i - 1)])
+    if i:
+        lower = lowers[i - 1]
+        width = bucket_width(lower)
+        if highest is not None and bucket_of(highest) == lower:
+            width = highest - lower + 1
+        below += histogram[lower] * min(1.0, (value - lower) / width)
+    return below
+
+
+def count_above(histogram, value, total, highest=None):
+    """Quantas das `total` pontuações do histograma ficam acima de `value` (arredondado)."""
+    # Pontuações são inteiras: "acima de v" é tudo que não fica abaixo de v + 1.
+    return round(total - count_below(histogram, value + 1, highest))
+
+
+def percentile(below, total):
+    """Porcentagem das pontuações abaixo, de 0 a 100 (None sem nenhuma pontuação)."""
+    return round(100.0 * below / total, 1) if total else None
@@ -6,7 +6,8 @@ document.addEventListener('DOMContentLoaded', () => {
     menuLayout = document.getElementById('menu-layout'), songSelectionContainer = document.getElementById('song-selection'),
     songListContainer = document.getElementById('song-list-container'), highScorePanel = document.getElementById('high-score-panel'),
     highScoreSongTitle = document.getElementById('high-score-song-title'), highScoreList = document.getElementById('high-score-list'),
-    actionButtons = document.getElementById('action-buttons'), startButton = document.getElementById('start-button'),
+    actionButtons = document.getElementById('action-buttons'), difficultySelect = document.getElementById('difficulty-select'),
+    startButton = document.getElementById('start-button'),
     backButton = document.getElementById('back-button'), endGameModal = document.getElementById('end-game-modal'),
     finalScoreDisplay = document.getElementById('final-score'), scoreForm = document.getElementById('score-form'),
     playerNameInput = document.getElementById('player-name'), 
@@ -16,12 +17,35 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- VARIÁVEIS DE ESTADO DO JOGO ---
     const audioPlayer = new Audio(), audioContext = new (window.AudioContext || window.webkitAudioContext)();
-    let songData, notesToSpawn, gameStartTime, score = 0, combo = 0, selectedSongId = null;
+    let songData, isPlaying = false, score = 0, combo = 0, selectedSongId = null;
+    let songsById = {};
     let isPaused = false;
+    // Música escolhida no menu: o beatmap e o áudio começam a carregar no
+    // clique, antes do "Começar". { songId, beatmap: Promise, audio: Promise }
+    let prefetched = null, cancelAudioLoad = null;
 
     // --- CONSTANTES ---
     const NOTE_FALL_DURATION = 4.0, PERFECT_WINDOW = 0.08, GOOD_WINDOW = 0.15;
     const NOTE_HIT_POSITION_Y = 95;
+    const NOTE_MISS_AFTER = NOTE_FALL_DURATION * 0.1; // Some da pista 10% depois da linha de acerto
+    const NOTE_WIDTH = 50, NOTE_HEIGHT = 25, NOTE_SPRITE_PADDING = 6;
+    const LANE_POSITIONS = [0.125, 0.375, 0.625, 0.875];
+    const NOTE_PENDING = 0, NOTE_HIT = 1, NOTE_MISSED = 2;
+
+    // --- LINHA DO TEMPO DAS NOTAS (arrays tipados, ordenados pelo tempo) ---
+    let noteTimes = new Float64Array(0), noteLanes = new Uint8Array(0), noteState = new Uint8Array(0);
+    let firstActiveNote = 0; // Índice da primeira nota que ainda pode estar na pista
+
+    // --- MOTOR DE JULGAMENTO ---
+    // Para cada pista: índices e tempos das suas notas, em ordem, e um cursor
+    // na primeira nota ainda não julgada.
+    let laneNoteIndex = [], laneNoteTimes = [], laneCursor = [];
+    let lastAudioTime = 0, lastAudioClock = 0;
+    const MAX_CLOCK_EXTRAPOLATION = 0.25;
+
+    // --- RENDERIZADOR EM CANVAS ---
+    const noteCanvas = document.getElementById('note-canvas'), noteCtx = noteCanvas.getContext('2d');
+    let canvasWidth = 0, canvasHeight = 0, noteSprites = [];
 
     // --- LÓGICA DO MENU ---
     async function initializeMenu() {
@@ -33,7 +57,9 @@ document.addEventListener('DOMContentLoaded', () => {
             const songs = await response.json();
             loadingText.style.display = 'none';
             songListContainer.innerHTML = '';
+            songsById = {};
             songs.forEach(song => {
+                songsById[song.id] = song;
                 const songButton = document.createElement('button');
                 songButton.className = 'song-item';
                 songButton.textContent = `${song.name} - ${song.artist}`;
@@ -42,11 +68,15 @@ document.addEventListener('DOMContentLoaded', () => {
                     document.querySelectorAll('.song-item.selected').forEach(btn => btn.classList.remove('selected'));
                     songButton.classList.add('selected');
                     selectedSongId = song.id;
+                    prefetchSong(song.id);
                     actionButtons.style.display = 'flex';
+                    showDifficulties(song.difficulties || []);
                     displayHighScores(song.id, song.name);
                 });
                 songListContainer.appendChild(songButton);
             });
+            // Jogar de novo reaproveita o que já foi carregado, a menos que o áudio tenha mudado.
+            if (prefetched && (songsById[prefetched.songId] || {}).audioUrl !== prefetched.audioUrl) prefetched = null;
             menuLayout.style.display = 'flex';
         } catch (error) {
             console.error("Erro ao inicializar menu:", error);
@@ -54,6 +84,23 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function showDifficulties(difficulties) {
+        difficultySelect.innerHTML = '';
+        difficulties.forEach(name => {
+            const option = document.createElement('option');
+            option.value = name;
+            option.textContent = name;
+            difficultySelect.appendChild(option);
+        });
+        // Beatmaps antigos só têm "notes": nesse caso não há o que escolher.
+        if (difficulties.length > 1) {
+            difficultySelect.value = difficulties.includes('Médio') ? 'Médio' : difficulties[0];
+            difficultySelect.style.display = 'block';
+        } else {
+            difficultySelect.style.display = 'none';
+        }
+    }
+
     function resetToMainMenu() {
         selectedSongId = null;
         document.querySelectorAll('.song-item.selected').forEach(btn => btn.classList.remove('selected'));
@@ -65,29 +112,236 @@ document.addEventListener('DOMContentLoaded', () => {
         playerNameInput.value = '';
     }
 
+    // Uma busca só, ao escolher a música: a conexão ao vivo
+    // (/api/scores/<música>/stream) fica para a página de ranking e os telões,
+    // para os menus abertos não prenderem threads do servidor.
     async function displayHighScores(songId, songName) {
         highScoreSongTitle.textContent = songName;
         highScoreList.innerHTML = '<li>Carregando...</li>';
         highScorePanel.style.display = 'block';
         try {
-            const response = await fetch(`/api/scores/${songId}`);
-            const scores = await response.json();
-            highScoreList.innerHTML = '';
-            if (scores.length === 0) {
-                highScoreList.innerHTML = '<li>Nenhum recorde ainda. Seja o primeiro!</li>';
-            } else {
-                scores.forEach(score => {
-                    const li = document.createElement('li');
-                    li.innerHTML = `<span>#${score.rank}</span> <span class="player-name">${score.player_name}</span> <span class="player-score">${score.score_value}</span>`;
-                    highScoreList.appendChild(li);
-                });
-            }
+            const response = await fetch(`/api/scores/${encodeURIComponent(songId)}`);
+            if (!response.ok) throw new Error('Falha ao buscar high scores');
+            renderHighScores(await response.json());
         } catch (error) {
             console.error("Erro ao buscar high scores:", error);
             highScoreList.innerHTML = '<li>Não foi possível carregar os scores.</li>';
         }
     }
 
+    function renderHighScores(scores) {
+        highScoreList.innerHTML = '';
+        if (scores.length === 0) {
+            highScoreList.innerHTML = '<li>Nenhum recorde ainda. Seja o primeiro!</li>';
+            return;
+        }
+        scores.forEach(score => {
+            const li = document.createElement('li');
+            const rank = document.createElement('span'), name = document.createElement('span'), value = document.createElement('span');
+            rank.textContent = `#${score.rank}`;
+            name.className = 'player-name';
+            name.textContent = score.player_name;
+            value.className = 'player-score';
+            value.textContent = score.score_value;
+            li.append(rank, ' ', name, ' ', value);
+            highScoreList.appendChild(li);
+        });
+    }
+
+    // --- FORMATO COMPACTO DO BEATMAP ---
+    // Tempos em ms como diferença para a nota anterior e uma pista por caractere.
+    function decodeChart(chart) {
+        const notes = new Array(chart.t.length);
+        let ms = 0;
+        for (let i = 0; i < chart.t.length; i++) {
+            ms += chart.t[i];
+            notes[i] = { time: ms / 1000, lane: chart.l.charCodeAt(i) - 48 };
+        }
+        return notes;
+    }
+
+    function decodeBeatmap(data) {
+        if (data.format !== 2) return data; // JSON original
+        const beatmap = { ...data };
+        delete beatmap.format;
+        if (data.charts) {
+            beatmap.charts = {};
+            Object.entries(data.charts).forEach(([name, chart]) => { beatmap.charts[name] = decodeChart(chart); });
+        }
+        beatmap.notes = typeof data.notes === 'string' ? beatmap.charts[data.notes] : decodeChart(data.notes);
+        return beatmap;
+    }
+
+    // Toca direto do servidor (com Range) assim que houver dados suficientes,
+    // em vez de baixar o arquivo inteiro antes. Trocar de música no meio do
+    // carregamento cancela o anterior.
+    function loadAudio(url) {
+        if (cancelAudioLoad) cancelAudioLoad();
+        return new Promise((resolve, reject) => {
+            const cleanup = () => {
+                audioPlayer.removeEventListener('canplaythrough', onReady);
+                audioPlayer.removeEventListener('error', onError);
+                cancelAudioLoad = null;
+            };
+            const onReady = () => { cleanup(); resolve(); };
+            const onError = () => { cleanup(); reject(new Error('Falha ao carregar o áudio')); };
+            cancelAudioLoad = () => { cleanup(); reject(new Error('Carregamento do áudio cancelado')); };
+            audioPlayer.addEventListener('canplaythrough', onReady);
+            audioPlayer.addEventListener('error', onError);
+            audioPlayer.preload = 'auto';
+            audioPlayer.src = url;
+            audioPlayer.load();
+        });
+    }
+
+    async function loadBeatmap(songId) {
+        const response = await fetch(`/api/beatmaps/${encodeURIComponent(songId)}`);
+        if (!response.ok) throw new Error('Falha ao carregar o mapa de batidas');
+        return decodeBeatmap(await response.json());
+    }
+
+    function prefetchSong(songId) {
+        if (prefetched && prefetched.songId === songId) return prefetched;
+        const song = songsById[songId];
+        const audioUrl = (song && song.audioUrl) || `/audio/${encodeURIComponent(songId)}`;
+        prefetched = { songId, audioUrl, beatmap: loadBeatmap(songId), audio: loadAudio(audioUrl) };
+        // Um erro aqui só aparece quando o jogador clicar em "Começar".
+        prefetched.beatmap.catch(() => {});
+        prefetched.audio.catch(() => {});
+        return prefetched;
+    }
+
+    function buildTimeline(chart) {
+        const sorted = [...chart].sort((a, b) => a.time - b.time);
+        noteTimes = Float64Array.from(sorted, note => note.time);
+        noteLanes = Uint8Array.from(sorted, note => note.lane);
+        noteState = new Uint8Array(sorted.length);
+        firstActiveNote = 0;
+        buildJudge();
+    }
+
+    function buildJudge() {
+        laneNoteIndex = []; laneNoteTimes = []; laneCursor = [];
+        for (let lane = 1; lane <= 4; lane++) {
+            const indices = [];
+            for (let i = 0; i < noteLanes.length; i++) {
+                if (noteLanes[i] === lane) indices.push(i);
+            }
+            laneNoteIndex[lane] = Int32Array.from(indices);
+            laneNoteTimes[lane] = Float64Array.from(indices, i => noteTimes[i]);
+            laneCursor[lane] = 0;
+        }
+        lastAudioTime = 0;
+        lastAudioClock = performance.now();
+    }
+
+    // Tempo da música pelo relógio do áudio (para junto com a pausa e segue o
+    // que está tocando). currentTime só avança em saltos, então interpolamos
+    // com performance.now() desde a última mudança, e descontamos a latência
+    // de saída para julgar pelo que o jogador está ouvindo.
+    function songTime() {
+        const now = performance.now();
+        const audioTime = audioPlayer.currentTime;
+        if (audioTime !== lastAudioTime || audioPlayer.paused) {
+            lastAudioTime = audioTime;
+            lastAudioClock = now;
+        }
+        let time = audioTime;
+        if (!audioPlayer.paused) {
+            time += Math.min((now - lastAudioClock) / 1000, MAX_CLOCK_EXTRAPOLATION) * audioPlayer.playbackRate;
+        }
+        return time - (audioContext.outputLatency || audioContext.baseLatency || 0);
+    }
+
+    function lowerBound(times, value, start) {
+        let low = start, high = times.length;
+        while (low < high) {
+            const mid = (low + high) >>> 1;
+            if (times[mid] < value) low = mid + 1; else high = mid;
+        }
+        return low;
+    }
+
+    // Roda a cada quadro, independente do desenho: toda nota que saiu da
+    // janela BOM sem ser tocada vira erro.
+    function judgeMisses(time) {
+        for (let lane = 1; lane <= 4; lane++) {
+            const times = laneNoteTimes[lane], indices = laneNoteIndex[lane];
+            let cursor = laneCursor[lane];
+            while (cursor < times.length && times[cursor] < time - GOOD_WINDOW) {
+                if (noteState[indices[cursor]] === NOTE_PENDING) {
+                    noteState[indices[cursor]] = NOTE_MISSED;
+                    updateCombo(false);
+                }
+                cursor++;
+            }
+            laneCursor[lane] = cursor;
+        }
+    }
+
+    function pillPath(ctx, x, y, width, height) {
+        const radius = height / 2;
+        ctx.beginPath();
+        ctx.arc(x + radius, y + radius, radius, Math.PI / 2, Math.PI * 1.5);
+        ctx.arc(x + width - radius, y + radius, radius, Math.PI * 1.5, Math.PI / 2);
+        ctx.closePath();
+    }
+
+    // Cada pista tem sua nota desenhada uma vez num canvas fora da tela;
+    // a cada quadro só copiamos esses sprites com drawImage.
+    function buildNoteSprites(ratio) {
+        const styles = getComputedStyle(document.documentElement);
+        const pad = NOTE_SPRITE_PADDING;
+        noteSprites = [1, 2, 3, 4].map(lane => {
+            const sprite = document.createElement('canvas');
+            sprite.width = Math.ceil((NOTE_WIDTH + pad * 2) * ratio);
+            sprite.height = Math.ceil((NOTE_HEIGHT + pad * 2) * ratio);
+            const ctx = sprite.getContext('2d');
+            ctx.scale(ratio, ratio);
+            pillPath(ctx, pad, pad, NOTE_WIDTH, NOTE_HEIGHT);
+            ctx.shadowColor = 'rgba(0, 0, 0, 0.5)';
+            ctx.shadowBlur = 5;
+            ctx.shadowOffsetY = 2;
+            ctx.fillStyle = styles.getPropertyValue(`--color-fret${lane}`).trim();
+            ctx.fill();
+            ctx.shadowColor = 'transparent';
+            ctx.strokeStyle = 'black';
+            ctx.lineWidth = 1;
+            ctx.stroke();
+            return sprite;
+        });
+    }
+
+    function resizeCanvas() {
+        const ratio = window.devicePixelRatio || 1;
+        canvasWidth = gameTrack.clientWidth;
+        canvasHeight = gameTrack.clientHeight;
+        noteCanvas.width = Math.round(canvasWidth * ratio);
+        noteCanvas.height = Math.round(canvasHeight * ratio);
+        noteCtx.setTransform(ratio, 0, 0, ratio, 0, 0);
+        buildNoteSprites(ratio);
+    }
+
+    function clearNotes() {
+        noteCtx.clearRect(0, 0, canvasWidth, canvasHeight);
+    }
+
+    // Só percorre as notas entre a primeira ativa e o horizonte de queda,
+    // então o custo não depende do tamanho do chart.
+    function drawNotes(time) {
+        clearNotes();
+        const pad = NOTE_SPRITE_PADDING;
+        const spriteWidth = NOTE_WIDTH + pad * 2, spriteHeight = NOTE_HEIGHT + pad * 2;
+        const horizon = time + NOTE_FALL_DURATION;
+        for (let i = firstActiveNote; i < noteTimes.length && noteTimes[i] <= horizon; i++) {
+            if (noteState[i] === NOTE_HIT) continue; // Erradas continuam caindo até sair da pista
+            const progress = (time - (noteTimes[i] - NOTE_FALL_DURATION)) / NOTE_FALL_DURATION;
+            const x = LANE_POSITIONS[noteLanes[i] - 1] * canvasWidth - NOTE_WIDTH / 2 - pad;
+            const y = progress * (NOTE_HIT_POSITION_Y / 100) * canvasHeight - pad;
+            noteCtx.drawImage(noteSprites[noteLanes[i] - 1], x, y, spriteWidth, spriteHeight);
+        }
+    }
+
     // --- LÓGICA DO JOGO ---
     async function loadAndStartSong() {
         if (!selectedSongId) return;
@@ -96,18 +350,13 @@ document.addEventListener('DOMContentLoaded', () => {
         loadingText.textContent = `Carregando ${selectedSongId}...`;
         loadingText.style.display = 'block';
         try {
-            const [beatmapResponse, audioBlob] = await Promise.all([
-                fetch(`/static/beatmaps/${selectedSongId}.json`),
-                fetch(`/static/audio/${selectedSongId}.mp3`).then(res => res.blob())
-            ]);
-            if (!beatmapResponse.ok) throw new Error('Falha ao carregar o mapa de batidas');
-            songData = await beatmapResponse.json();
-            const audioUrl = URL.createObjectURL(audioBlob);
-            audioPlayer.src = audioUrl;
+            const { beatmap, audio } = prefetchSong(selectedSongId);
+            [songData] = await Promise.all([beatmap, audio]);
             console.log("Música carregada:", songData.songName);
             await startGame();
         } catch (error) {
             console.error("Erro ao carregar a música:", error);
+            prefetched = null; // Na próxima tentativa, carrega de novo.
             alert(`Não foi possível carregar a música ${selectedSongId}.`);
             initializeMenu();
         }
@@ -117,16 +366,18 @@ document.addEventListener('DOMContentLoaded', () => {
         if (audioContext.state === 'suspended') await audioContext.resume();
         score = 0; combo = 0; isPaused = false;
         updateScore('reset');
-        notesToSpawn = [...songData.notes].sort((a, b) => a.time - b.time);
-        document.querySelectorAll('.note').forEach(n => n.remove());
+        const chart = (songData.charts && songData.charts[difficultySelect.value]) || songData.notes;
+        buildTimeline(chart);
         startScreen.style.display = 'none';
+        resizeCanvas();
+        clearNotes();
         await audioPlayer.play();
-        gameStartTime = Date.now();
+        isPlaying = true;
         requestAnimationFrame(gameLoop);
     }
     
     function togglePause() {
-        if (!gameStartTime || audioPlayer.ended) return;
+        if (!isPlaying || audioPlayer.ended) return;
         isPaused = !isPaused;
         if (isPaused) {
             audioPlayer.pause();
@@ -145,53 +396,36 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
         
-        const elapsedTime = (Date.now() - gameStartTime) / 1000;
-        while (notesToSpawn.length > 0 && notesToSpawn[0].time <= elapsedTime + NOTE_FALL_DURATION) {
-            const noteData = notesToSpawn.shift();
-            spawnNote(noteData);
+        const time = songTime();
+        judgeMisses(time);
+        // Notas que já passaram da pista não precisam mais ser desenhadas.
+        while (firstActiveNote < noteTimes.length && noteTimes[firstActiveNote] < time - NOTE_MISS_AFTER) {
+            firstActiveNote++;
         }
-        document.querySelectorAll('.note').forEach(noteEl => {
-            const timeToHit = parseFloat(noteEl.dataset.time);
-            const spawnTime = timeToHit - NOTE_FALL_DURATION;
-            const progress = (elapsedTime - spawnTime) / NOTE_FALL_DURATION;
-            const currentY = progress * NOTE_HIT_POSITION_Y;
-            noteEl.style.top = `${currentY}%`;
-            if (progress > 1.1) {
-                noteEl.remove();
-                updateCombo(false);
-            }
-        });
+        drawNotes(time);
         requestAnimationFrame(gameLoop);
     }
 
-    function spawnNote(noteData) {
-        const noteEl = document.createElement('div');
-        noteEl.classList.add('note', `color-${noteData.lane}`);
-        noteEl.dataset.time = noteData.time;
-        gameTrack.appendChild(noteEl);
-    }
-    
+    // Busca binária na pista pela primeira nota dentro da janela BOM, a partir
+    // do cursor; as notas anteriores ficam para judgeMisses.
     function checkHit(lane) {
-        const elapsedTime = (Date.now() - gameStartTime) / 1000;
-        const targetNotes = document.querySelectorAll(`.note.color-${lane}`);
-        let hitNote = null;
-        for (const note of targetNotes) {
-            const diff = Math.abs(elapsedTime - parseFloat(note.dataset.time));
-            if (diff <= GOOD_WINDOW) { hitNote = note; break; }
-        }
-        if (hitNote) {
-            const diff = Math.abs(elapsedTime - parseFloat(hitNote.dataset.time));
-            if (diff <= PERFECT_WINDOW) {
-                updateScore('perfect');
-                showHitFeedback('PERFEITO!', lane);
-            } else {
-                updateScore('good');
-                showHitFeedback('BOM!', lane);
-            }
-            hitNote.remove();
-            return true;
+        const time = songTime();
+        const times = laneNoteTimes[lane], indices = laneNoteIndex[lane];
+        let i = lowerBound(times, time - GOOD_WINDOW, laneCursor[lane]);
+        while (i < times.length && noteState[indices[i]] !== NOTE_PENDING) i++;
+        if (i >= times.length || times[i] > time + GOOD_WINDOW) return false;
+
+        const diff = Math.abs(time - times[i]);
+        if (diff <= PERFECT_WINDOW) {
+            updateScore('perfect');
+            showHitFeedback('PERFEITO!', lane);
+        } else {
+            updateScore('good');
+            showHitFeedback('BOM!', lane);
         }
-        return false;
+        noteState[indices[i]] = NOTE_HIT;
+        if (i === laneCursor[lane]) laneCursor[lane] = i + 1;
+        return true;
     }
 
     function updateScore(rank) {
@@ -226,7 +460,7 @@ document.addEventListener('DOMContentLoaded', () => {
     function endGame(finalScore) {
         audioPlayer.pause();
         audioPlayer.currentTime = 0;
-        gameStartTime = null;
+        isPlaying = false;
         finalScoreDisplay.textContent = finalScore;
         endGameModal.style.display = 'flex';
         playerNameInput.focus();
@@ -272,13 +506,13 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
     quitButton.addEventListener('click', () => {
-        if (!gameStartTime || audioPlayer.ended) return; // Não faz nada se o jogo não começou
+        if (!isPlaying || audioPlayer.ended) return; // Não faz nada se o jogo não começou
         if (confirm("Tem certeza que deseja sair? Sua pontuação não será salva.")) {
             audioPlayer.pause();
             audioPlayer.currentTime = 0;
             isPaused = false;
-            gameStartTime = null;
-            document.querySelectorAll('.note').forEach(n => n.remove());
+            isPlaying = false;
+            clearNotes();
             initializeMenu();
         }
     });
@@ -290,7 +524,7 @@ document.addEventListener('DOMContentLoaded', () => {
         }
         const key = event.key.toLowerCase();
         const fret = fretMap[key];
-        if (fret && !event.repeat && gameStartTime && !isPaused) {
+        if (fret && !event.repeat && isPlaying && !isPaused) {
             fret.classList.add('active');
             const laneNumber = parseInt(fret.id.split('-')[1]);
             const wasHit = checkHit(laneNumber);
@@ -299,6 +533,7 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
     });
+    window.addEventListener('resize', () => { if (isPlaying) resizeCanvas(); });
     window.addEventListener('keyup', (event) => {
         const key = event.key.toLowerCase();
         const fret = fretMap[key];
@@ -306,5 +541,9 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     // --- INICIALIZAÇÃO ---
+    // O service worker guarda as músicas já jogadas (ver static/js/sw.js).
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch(error => console.warn('Service worker não registrado:', error));
+    }
     initializeMenu();
 });
\ No newline at end of file
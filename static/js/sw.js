@@ -0,0 +1,195 @@
+// Service worker do Guitar Flask: guarda as músicas já jogadas (beatmap e
+// áudio) para que a próxima partida comece na hora, mesmo sem rede.
+//
+// - Áudio com versão na URL (?v=<hash do conteúdo>): o conteúdo nunca muda,
+//   então vem direto do cache. Sem a versão, busca na rede e usa o cache só
+//   se estiver offline.
+// - Beatmaps: sempre revalidados pelo ETag (o cache HTTP do navegador cuida
+//   do 304); o cache do service worker é o plano B sem rede.
+// - As músicas ocupam no máximo MAX_SONG_CACHE_BYTES: quando passa disso, sai
+//   o que foi usado há mais tempo (LRU).
+// - A página, o CSS, o JS e a lista de músicas ficam num cache à parte para o
+//   menu abrir offline.
+
+const SONG_CACHE = 'guitarflask-songs-v1';
+const SHELL_CACHE = 'guitarflask-shell-v1';
+const META_KEY = '/__sw-meta__';
+const MAX_SONG_CACHE_BYTES = 200 * 1024 * 1024;
+const TOUCH_INTERVAL_MS = 60 * 1000; // Não regrava o "último uso" a cada pedaço de áudio.
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        const keep = [SONG_CACHE, SHELL_CACHE];
+        for (const name of await caches.keys()) {
+            if (!keep.includes(name)) await caches.delete(name);
+        }
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (url.pathname.startsWith('/audio/')) {
+        event.respondWith(handleAudio(event, url));
+    } else if (url.pathname.startsWith('/api/beatmaps/') && !url.pathname.startsWith('/api/beatmaps/jobs')) {
+        event.respondWith(networkFirst(event, SONG_CACHE, url.href, true));
+    } else if (request.mode === 'navigate' || url.pathname.startsWith('/static/') || url.pathname === '/api/songs') {
+        event.respondWith(networkFirst(event, SHELL_CACHE, url.href, false));
+    }
+});
+
+// --- ÁUDIO ---
+
+async function handleAudio(event, url) {
+    const cache = await caches.open(SONG_CACHE);
+    const key = url.href;
+    const range = event.request.headers.get('Range');
+    const versioned = url.searchParams.has('v');
+
+    if (versioned || !navigator.onLine) {
+        const cached = await cache.match(key);
+        if (cached) {
+            event.waitUntil(touch(key));
+            return range ? sliceResponse(cached, range) : cached;
+        }
+    }
+
+    // Pedido do começo do arquivo (o que o <audio> faz ao carregar): baixa o
+    // arquivo inteiro, entrega ao player e guarda uma cópia ao mesmo tempo.
+    if (!range || /^bytes=0-$/.test(range)) {
+        try {
+            const response = await fetch(key, { cache: versioned ? 'default' : 'no-cache' });
+            if (response.ok && response.status === 200) {
+                event.waitUntil(store(cache, key, response.clone()));
+            }
+            return response;
+        } catch (error) {
+            const cached = await cache.match(key);
+            if (cached) return range ? sliceResponse(cached, range) : cached;
+            throw error;
+        }
+    }
+
+    // Um salto para o meio de um áudio que ainda não está no cache: vai à rede.
+    try {
+        return await fetch(event.request);
+    } catch (error) {
+        const cached = await cache.match(key);
+        if (cached) return sliceResponse(cached, range);
+        throw error;
+    }
+}
+
+// Responde a um pedido de Range ("bytes=início-fim") com um pedaço do arquivo em cache.
+async function sliceResponse(response, range) {
+    const blob = await response.blob();
+    const match = /^bytes=(\d*)-(\d*)$/.exec(range.trim());
+    if (!match || (match[1] === '' && match[2] === '')) {
+        return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${blob.size}` } });
+    }
+    let start, end;
+    if (match[1] === '') { // Sufixo: os últimos N bytes
+        start = Math.max(0, blob.size - Number(match[2]));
+        end = blob.size - 1;
+    } else {
+        start = Number(match[1]);
+        end = match[2] === '' ? blob.size - 1 : Math.min(Number(match[2]), blob.size - 1);
+    }
+    if (start >= blob.size || start > end) {
+        return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${blob.size}` } });
+    }
+    return new Response(blob.slice(start, end + 1), {
+        status: 206,
+        headers: {
+            'Content-Type': response.headers.get('Content-Type') || 'audio/mpeg',
+            'Content-Range': `bytes ${start}-${end}/${blob.size}`,
+            'Content-Length': String(end - start + 1),
+            'Accept-Ranges': 'bytes'
+        }
+    });
+}
+
+// --- REDE PRIMEIRO, CACHE SEM REDE ---
+
+async function networkFirst(event, cacheName, key, countsTowardLimit) {
+    const cache = await caches.open(cacheName);
+    try {
+        // no-cache: o navegador revalida com If-None-Match e reaproveita o corpo num 304.
+        const response = await fetch(event.request, { cache: 'no-cache' });
+        if (response.ok) {
+            const copy = response.clone();
+            event.waitUntil(countsTowardLimit ? store(cache, key, copy) : cache.put(key, copy));
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(key);
+        if (cached) {
+            if (countsTowardLimit) event.waitUntil(touch(key));
+            return cached;
+        }
+        throw error;
+    }
+}
+
+// --- LIMITE DE TAMANHO (LRU) ---
+// O tamanho e o último uso de cada entrada ficam num JSON dentro do próprio
+// cache. Todas as mudanças passam por uma fila, uma de cada vez.
+
+let metaQueue = Promise.resolve();
+
+function withMeta(change) {
+    const next = metaQueue.then(async () => {
+        const cache = await caches.open(SONG_CACHE);
+        const stored = await cache.match(META_KEY);
+        const meta = stored ? await stored.json() : {};
+        if (await change(meta, cache) !== false) {
+            await cache.put(META_KEY, new Response(JSON.stringify(meta), {
+                headers: { 'Content-Type': 'application/json' }
+            }));
+        }
+    });
+    metaQueue = next.catch(error => console.error('Erro no cache de músicas:', error));
+    return metaQueue;
+}
+
+async function store(cache, key, response) {
+    const blob = await response.blob();
+    // O corpo já chega descomprimido: a cópia não pode dizer que está em gzip/br.
+    const headers = new Headers(response.headers);
+    headers.delete('Content-Encoding');
+    headers.set('Content-Length', String(blob.size));
+    await cache.put(key, new Response(blob, { status: response.status, headers }));
+    return withMeta(async meta => {
+        // Uma versão nova do mesmo áudio substitui a antiga.
+        const path = new URL(key).pathname;
+        for (const other of Object.keys(meta)) {
+            if (other !== key && new URL(other).pathname === path) {
+                await cache.delete(other);
+                delete meta[other];
+            }
+        }
+        meta[key] = { size: blob.size, lastUsed: Date.now() };
+        let total = Object.values(meta).reduce((sum, entry) => sum + entry.size, 0);
+        const oldestFirst = Object.entries(meta).sort((a, b) => a[1].lastUsed - b[1].lastUsed);
+        for (const [entryKey, entry] of oldestFirst) {
+            if (total <= MAX_SONG_CACHE_BYTES || entryKey === key) break;
+            await cache.delete(entryKey);
+            delete meta[entryKey];
+            total -= entry.size;
+        }
+    });
+}
+
+function touch(key) {
+    return withMeta(meta => {
+        const entry = meta[key];
+        if (!entry || Date.now() - entry.lastUsed < TOUCH_INTERVAL_MS) return false;
+        entry.lastUsed = Date.now();
+    });
+}
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Os módulos do projeto ficam na raiz do repositório, fora de um pacote.
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: testes demorados (pule com -m 'not slow')")
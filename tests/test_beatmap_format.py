@@ -0,0 +1,66 @@
+"""
+O formato compacto precisa voltar ao JSON original: mesmas notas, em ordem
+de tempo, com os tempos arredondados para milissegundos.
+"""
+import gzip
+import json
+import os
+
+import beatmap_format
+
+
+def beatmap_de_exemplo():
+    facil = [{'time': 2.0, 'lane': 3}, {'time': 0.5004, 'lane': 0}, {'time': 1.25, 'lane': 1}]
+    dificil = [{'time': 0.5, 'lane': 0}, {'time': 0.75, 'lane': 4}, {'time': 1.0, 'lane': 2}]
+    return {'song': 'Teste - Compacto', 'bpm': 120.0, 'notes': list(dificil),
+            'charts': {'facil': facil, 'dificil': dificil}}
+
+
+def ida_e_volta(beatmap):
+    return beatmap_format.from_compact(json.loads(beatmap_format.dumps_compact(beatmap)))
+
+
+def test_ida_e_volta_preserva_notas_e_metadados():
+    beatmap = beatmap_de_exemplo()
+    compacto = beatmap_format.to_compact(beatmap)
+    assert compacto['notes'] == 'dificil'  # Notas iguais a um chart viram só o nome dele.
+    assert ida_e_volta(beatmap) == {
+        'song': 'Teste - Compacto', 'bpm': 120.0,
+        'notes': beatmap['charts']['dificil'],
+        'charts': {
+            'facil': [{'time': 0.5, 'lane': 0}, {'time': 1.25, 'lane': 1}, {'time': 2.0, 'lane': 3}],
+            'dificil': beatmap['charts']['dificil'],
+        },
+    }
+
+
+def test_ida_e_volta_com_notas_proprias_e_sem_charts():
+    beatmap = {'song': 'Teste - Sem Charts', 'notes': [{'time': 3.1416, 'lane': 2}, {'time': 0.001, 'lane': 1}]}
+    assert ida_e_volta(beatmap) == {
+        'song': 'Teste - Sem Charts',
+        'notes': [{'time': 0.001, 'lane': 1}, {'time': 3.142, 'lane': 2}],
+    }
+    assert ida_e_volta({'notes': []}) == {'notes': []}
+
+
+def test_ensure_compact_grava_variantes_e_segue_o_original(tmp_path):
+    beatmap = beatmap_de_exemplo()
+    original = tmp_path / "Teste - Compacto.json"
+    original.write_text(json.dumps(beatmap), encoding='utf-8')
+    beatmap_format.ensure_compact(str(tmp_path), 'Teste - Compacto')
+
+    caminho = beatmap_format.compact_path(str(tmp_path), 'Teste - Compacto')
+    with open(caminho, 'rb') as f:
+        dados = f.read()
+    with open(beatmap_format.compact_path(str(tmp_path), 'Teste - Compacto', 'gzip'), 'rb') as f:
+        assert gzip.decompress(f.read()) == dados
+    assert beatmap_format.from_compact(json.loads(dados)) == ida_e_volta(beatmap)
+    assert not [n for n in os.listdir(os.path.dirname(caminho)) if n.endswith('.tmp')]
+
+    # Editado à mão depois da conversão: a versão compacta é refeita.
+    beatmap['notes'] = [{'time': 9.0, 'lane': 4}]
+    original.write_text(json.dumps(beatmap), encoding='utf-8')
+    os.utime(original, ns=(os.stat(caminho).st_mtime_ns + 1,) * 2)
+    beatmap_format.ensure_compact(str(tmp_path), 'Teste - Compacto')
+    with open(caminho, 'rb') as f:
+        assert beatmap_format.from_compact(json.loads(f.read()))['notes'] == [{'time': 9.0, 'lane': 4}]
@@ -0,0 +1,45 @@
+"""
+O librosa (com numba e scipy) leva segundos para importar: o modo aleatório
+do assistente e o servidor web não podem carregá-lo. Cada verificação roda
+num interpretador novo, sem nada já importado.
+"""
+import subprocess
+import sys
+
+from conftest import RAIZ
+
+MODULOS_PESADOS = ("librosa", "numba", "scipy")
+
+
+def modulos_carregados(codigo, modulos):
+    """Roda `codigo` num processo novo e devolve quais de `modulos` ele carregou."""
+    codigo += f"\nimport sys\nprint(','.join(m for m in {modulos!r} if m in sys.modules))"
+    resultado = subprocess.run([sys.executable, '-c', codigo], capture_output=True, text=True, cwd=RAIZ)
+    assert resultado.returncode == 0, resultado.stderr
+    ultima_linha = (resultado.stdout.strip().splitlines() or [''])[-1]
+    return [m for m in ultima_linha.split(',') if m]
+
+
+def escrever_mp3_silencioso(caminho, segundos):
+    """MP3 válido só com quadros vazios (128 kbps, 44,1 kHz), sem precisar de encoder."""
+    quadro = bytes.fromhex('fffb9064') + bytes(413)
+    with open(caminho, 'wb') as f:
+        f.write(quadro * int(segundos * 44100 / 1152))
+
+
+def test_modo_aleatorio_nao_importa_librosa(tmp_path):
+    audio, beatmaps = tmp_path / "audio", tmp_path / "beatmaps"
+    audio.mkdir()
+    beatmaps.mkdir()
+    escrever_mp3_silencioso(audio / "Teste - Silencio.mp3", 30)
+    codigo = (
+        "import assistente_beatmaps as a\n"
+        f"resumo = a.processar_musica('Teste - Silencio', a.MODOS['aleatorio'], '2', seed=1, "
+        f"pasta_audio={str(audio)!r}, pasta_beatmaps={str(beatmaps)!r})\n"
+        "assert resumo['ok'] and resumo['notas'] > 0, resumo"
+    )
+    assert modulos_carregados(codigo, MODULOS_PESADOS) == []
+
+
+def test_servidor_nao_importa_analise():
+    assert modulos_carregados("import app", MODULOS_PESADOS + ("numpy",)) == []
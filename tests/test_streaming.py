@@ -0,0 +1,62 @@
+"""
+A análise em blocos (para faixas longas) tem que achar os mesmos onsets que
+a análise completa, com menos memória. Usa faixas sintéticas de cliques.
+"""
+import tracemalloc
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip("soundfile")
+librosa = pytest.importorskip("librosa")
+
+import assistente_beatmaps
+
+TOLERANCIA_QUADROS = 2
+TAXA_MINIMA = 0.95
+TOLERANCIA_MEMORIA = 0.2  # Diferença relativa aceita entre os picos em blocos.
+
+
+def faixa_de_cliques(caminho, duracao, sr=44100, seed=0):
+    rng = np.random.default_rng(seed)
+    tempos = np.sort(rng.uniform(0.5, duracao - 1.0, size=2 * duracao))
+    y = librosa.clicks(times=tempos, sr=sr, length=sr * duracao)
+    y += 0.01 * rng.standard_normal(len(y))
+    sf.write(caminho, y, sr)
+
+
+def analisar_medindo_memoria(caminho, streaming):
+    tracemalloc.start()
+    try:
+        dados = assistente_beatmaps.analisar_audio(caminho, usar_cache=False, streaming=streaming)
+        return dados["onset_frames"], tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("duracao", [60, 240])
+def test_analise_em_blocos_bate_com_a_completa(tmp_path, duracao):
+    caminho = str(tmp_path / f"cliques_{duracao}s.wav")
+    faixa_de_cliques(caminho, duracao)
+    completo, pico_completo = analisar_medindo_memoria(caminho, streaming=False)
+    blocos, pico_blocos = analisar_medindo_memoria(caminho, streaming=True)
+
+    assert len(completo) > 0
+    distancias = np.abs(blocos[:, None] - completo[None, :]).min(axis=0) if len(blocos) else np.full(len(completo), np.inf)
+    taxa = float(np.mean(distancias <= TOLERANCIA_QUADROS))
+    assert taxa >= TAXA_MINIMA, f"só {taxa:.1%} dos onsets coincidem em até {TOLERANCIA_QUADROS} quadros"
+    assert pico_blocos < pico_completo, f"blocos: {pico_blocos / 1e6:.0f} MB, completa: {pico_completo / 1e6:.0f} MB"
+
+
+@pytest.mark.slow
+def test_memoria_dos_blocos_nao_cresce_com_a_duracao(tmp_path):
+    # O pico em blocos fica perto de 36 MB tanto com 60 s quanto com 240 s (a
+    # completa vai de ~45 a ~180 MB); a folga cobre o aquecimento da primeira chamada.
+    picos = {}
+    for duracao in (60, 240):
+        caminho = str(tmp_path / f"cliques_{duracao}s.wav")
+        faixa_de_cliques(caminho, duracao)
+        picos[duracao] = analisar_medindo_memoria(caminho, streaming=True)[1]
+    assert abs(picos[240] - picos[60]) <= TOLERANCIA_MEMORIA * min(picos.values()), \
+        f"60 s: {picos[60] / 1e6:.0f} MB, 240 s: {picos[240] / 1e6:.0f} MB"
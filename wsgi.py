@@ -0,0 +1,8 @@
+"""
+Ponto de entrada para servidores WSGI em produção:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import create_app
+
+app = create_app('production')